@@ -4,72 +4,209 @@
 分析和可视化动量策略回测结果
 """
 
-import pandas as pd
-import numpy as np
+import hashlib
+import math
 from datetime import datetime
-import glob
 import os
+from functools import lru_cache
+from types import SimpleNamespace
+
+DATA_DIR = "../data"
+
+# 读取时直接指定列类型：字符串列用category，时间列读取时解析
+TRADE_DTYPES = {
+    'action': 'category',
+    'strategy': 'category',
+    'symbol': 'category',
+    'reason': 'category',
+    'pnl_value': 'float64',
+    'pnl_pct': 'float64',
+    'holding_period': 'float64',
+}
+PORTFOLIO_DTYPES = {
+    'total_value': 'float64',
+}
+
+# 只读取分析用到的列（无卖出时CSV中没有盈亏列，按列名过滤以兼容）
+TRADE_COLUMNS = {'timestamp', *TRADE_DTYPES}
+PORTFOLIO_COLUMNS = {'timestamp', *PORTFOLIO_DTYPES}
+
+@lru_cache(maxsize=None)
+def find_latest_result_files(data_dir=DATA_DIR):
+    """单次扫描目录，找出最新的交易记录和组合历史文件"""
+    latest_trade_file = None
+    latest_portfolio_file = None
+    
+    try:
+        entries = os.scandir(data_dir)
+    except FileNotFoundError:
+        return None, None
+    
+    # 文件名中带时间戳，按文件名取最大即最新，无需排序
+    with entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith('.csv'):
+                continue
+            if '_trades_' in name:
+                if latest_trade_file is None or name > os.path.basename(latest_trade_file):
+                    latest_trade_file = entry.path
+            elif '_portfolio_' in name:
+                if latest_portfolio_file is None or name > os.path.basename(latest_portfolio_file):
+                    latest_portfolio_file = entry.path
+    
+    return latest_trade_file, latest_portfolio_file
+
+def read_csv_cached(csv_path, columns, **read_kwargs):
+    """读取CSV中columns包含的列并缓存解析结果，CSV未更新时直接读取缓存，保留category/datetime类型
+    
+    缓存文件名带有列和读取参数的哈希，读取参数变化后不会误用旧缓存。
+    """
+    import pandas as pd
+    
+    spec = repr((sorted(columns), sorted(read_kwargs.items())))
+    cache_prefix = csv_path + '.'
+    cache_path = f"{cache_prefix}{hashlib.md5(spec.encode()).hexdigest()[:8]}.pkl"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"⚠️  读取缓存失败 {os.path.basename(cache_path)}: {e}")
+    
+    df = pd.read_csv(csv_path, usecols=lambda col: col in columns, **read_kwargs)
+    try:
+        cache_dir = os.path.dirname(cache_path) or '.'
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if path.startswith(cache_prefix) and name.endswith('.pkl') and path != cache_path:
+                os.remove(path)
+        # 先写临时文件再替换，避免并发运行时读到写了一半的缓存
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  写入缓存失败 {os.path.basename(cache_path)}: {e}")
+    return df
 
 def load_latest_backtest_results():
     """加载最新的回测结果"""
     # 查找最新的回测文件
-    trade_files = glob.glob("../data/*_trades_*.csv")
-    portfolio_files = glob.glob("../data/*_portfolio_*.csv")
+    latest_trade_file, latest_portfolio_file = find_latest_result_files()
     
-    if not trade_files or not portfolio_files:
+    if latest_trade_file is None or latest_portfolio_file is None:
         print("❌ 未找到回测结果文件")
         return None, None
     
-    # 按时间排序，取最新的
-    trade_files.sort()
-    portfolio_files.sort()
-    
-    latest_trade_file = trade_files[-1]
-    latest_portfolio_file = portfolio_files[-1]
-    
     print(f"📊 加载回测结果:")
     print(f"   交易记录: {os.path.basename(latest_trade_file)}")
     print(f"   组合历史: {os.path.basename(latest_portfolio_file)}")
     
-    trades_df = pd.read_csv(latest_trade_file)
-    portfolio_df = pd.read_csv(latest_portfolio_file)
+    trades_df = read_csv_cached(latest_trade_file, TRADE_COLUMNS,
+                                dtype=TRADE_DTYPES, parse_dates=['timestamp'])
+    portfolio_df = read_csv_cached(latest_portfolio_file, PORTFOLIO_COLUMNS,
+                                   dtype=PORTFOLIO_DTYPES, parse_dates=['timestamp'])
     
     return trades_df, portfolio_df
 
-def analyze_trading_performance(trades_df):
+def extract_sell_arrays(sell_trades):
+    """把卖出记录用到的列一次性取成NumPy数组，后续统计直接在数组上计算"""
+    if len(sell_trades) == 0:
+        return SimpleNamespace(n=0)
+    
+    pnl_value = sell_trades['pnl_value'].to_numpy()
+    return SimpleNamespace(
+        n=len(sell_trades),
+        pnl_pct=sell_trades['pnl_pct'].to_numpy(),
+        pnl_value=pnl_value,
+        holding=sell_trades['holding_period'].to_numpy(),
+        # 盈利标记只计算一次，供各项统计复用
+        is_win=pnl_value > 0,
+        # 分类列保留整数编码和类别名，分组统计直接用编码做np.bincount
+        strategy=(sell_trades['strategy'].cat.codes.to_numpy(), sell_trades['strategy'].cat.categories),
+        symbol=(sell_trades['symbol'].cat.codes.to_numpy(), sell_trades['symbol'].cat.categories),
+        reason=(sell_trades['reason'].cat.codes.to_numpy(), sell_trades['reason'].cat.categories)
+    )
+
+def aggregate_by_category(column, sell_arrays):
+    """按分类编码用np.bincount聚合卖出记录，只保留有交易的类别"""
+    import numpy as np
+    
+    codes, categories = column
+    # 编码-1表示缺失值，与groupby一致不参与分组
+    valid = codes >= 0
+    codes = codes[valid]
+    k = len(categories)
+    
+    trades = np.bincount(codes, minlength=k)
+    used = trades > 0
+    
+    def group_sum(values):
+        return np.bincount(codes, weights=values[valid], minlength=k)[used]
+    
+    return SimpleNamespace(
+        names=np.asarray(categories, dtype=object)[used],
+        trades=trades[used],
+        wins=group_sum(sell_arrays.is_win),
+        total_return=group_sum(sell_arrays.pnl_pct),
+        total_value=group_sum(sell_arrays.pnl_value),
+        total_holding=group_sum(sell_arrays.holding)
+    )
+
+def compute_sell_stats(sell_arrays):
+    """一次遍历卖出记录，计算各报告共用的盈亏和持仓统计"""
+    n = sell_arrays.n
+    if n == 0:
+        return SimpleNamespace(n=0, wins=0, losses=0, win_rate=0, avg_return=0,
+                               avg_profit=0, avg_loss=0, hold_mean=0, hold_min=0,
+                               hold_max=0)
+    
+    pnl_pct = sell_arrays.pnl_pct
+    holding = sell_arrays.holding
+    win = sell_arrays.is_win
+    wins = int(win.sum())
+    
+    return SimpleNamespace(
+        n=n,
+        wins=wins,
+        losses=n - wins,
+        win_rate=wins / n,
+        avg_return=pnl_pct.mean(),
+        avg_profit=pnl_pct[win].mean() if wins > 0 else 0,
+        avg_loss=pnl_pct[~win].mean() if wins < n else 0,
+        hold_mean=holding.mean(),
+        hold_min=holding.min(),
+        hold_max=holding.max()
+    )
+
+def analyze_trading_performance(trades_df, sell_stats, n_buy):
     """分析交易表现"""
     print("\n📈 交易表现分析")
     print("="*60)
     
-    if trades_df.empty:
+    if len(trades_df) == 0:
         print("❌ 无交易记录")
         return
     
     # 基础统计
     total_trades = len(trades_df)
-    buy_trades = trades_df[trades_df['action'] == 'BUY']
-    sell_trades = trades_df[trades_df['action'] == 'SELL']
     
     print(f"总交易次数: {total_trades}")
-    print(f"买入次数: {len(buy_trades)}")
-    print(f"卖出次数: {len(sell_trades)}")
+    print(f"买入次数: {n_buy}")
+    print(f"卖出次数: {sell_stats.n}")
     
-    if len(sell_trades) == 0:
+    if sell_stats.n == 0:
         print("⚠️  暂无卖出交易，无法计算盈亏")
         return
     
     # 盈亏分析
-    profitable_trades = sell_trades[sell_trades['pnl_value'] > 0]
-    losing_trades = sell_trades[sell_trades['pnl_value'] <= 0]
-    
-    win_rate = len(profitable_trades) / len(sell_trades)
-    avg_profit = profitable_trades['pnl_pct'].mean() if len(profitable_trades) > 0 else 0
-    avg_loss = losing_trades['pnl_pct'].mean() if len(losing_trades) > 0 else 0
+    win_rate = sell_stats.win_rate
+    avg_profit = sell_stats.avg_profit
+    avg_loss = sell_stats.avg_loss
     
     print(f"\n💰 盈亏统计:")
     print(f"   胜率: {win_rate:.2%}")
-    print(f"   盈利交易: {len(profitable_trades)} 次")
-    print(f"   亏损交易: {len(losing_trades)} 次")
+    print(f"   盈利交易: {sell_stats.wins} 次")
+    print(f"   亏损交易: {sell_stats.losses} 次")
     print(f"   平均盈利: {avg_profit:.2%}")
     print(f"   平均亏损: {avg_loss:.2%}")
     
@@ -78,145 +215,132 @@ def analyze_trading_performance(trades_df):
         print(f"   盈亏比: {profit_loss_ratio:.2f}")
     
     # 持仓时间分析
-    avg_holding_time = sell_trades['holding_period'].mean()
     print(f"\n⏰ 持仓时间:")
-    print(f"   平均持仓: {avg_holding_time:.1f} 小时")
-    print(f"   最短持仓: {sell_trades['holding_period'].min():.1f} 小时")
-    print(f"   最长持仓: {sell_trades['holding_period'].max():.1f} 小时")
+    print(f"   平均持仓: {sell_stats.hold_mean:.1f} 小时")
+    print(f"   最短持仓: {sell_stats.hold_min:.1f} 小时")
+    print(f"   最长持仓: {sell_stats.hold_max:.1f} 小时")
 
-def analyze_strategy_performance(trades_df):
+def analyze_strategy_performance(sell_arrays):
     """分析各策略表现"""
+    import numpy as np
+    
     print("\n📊 策略表现分析")
     print("="*60)
     
-    sell_trades = trades_df[trades_df['action'] == 'SELL']
-    if sell_trades.empty:
+    if sell_arrays.n == 0:
         print("❌ 无卖出交易记录")
         return
     
-    # 按策略分组分析
-    strategy_stats = []
-    
-    for strategy in sell_trades['strategy'].unique():
-        strategy_trades = sell_trades[sell_trades['strategy'] == strategy]
-        
-        total_trades = len(strategy_trades)
-        profitable_trades = len(strategy_trades[strategy_trades['pnl_value'] > 0])
-        win_rate = profitable_trades / total_trades
-        
-        total_pnl = strategy_trades['pnl_pct'].sum()
-        avg_pnl = strategy_trades['pnl_pct'].mean()
-        total_value = strategy_trades['pnl_value'].sum()
-        
-        avg_holding = strategy_trades['holding_period'].mean()
-        
-        strategy_stats.append({
-            'strategy': strategy,
-            'trades': total_trades,
-            'win_rate': win_rate,
-            'total_return': total_pnl,
-            'avg_return': avg_pnl,
-            'total_value': total_value,
-            'avg_holding': avg_holding
-        })
+    # 按策略编码聚合（np.bincount一次遍历完成各项求和）
+    stats = aggregate_by_category(sell_arrays.strategy, sell_arrays)
+    win_rate = stats.wins / stats.trades
+    avg_return = stats.total_return / stats.trades
+    avg_holding = stats.total_holding / stats.trades
     
     # 排序并显示
-    strategy_stats.sort(key=lambda x: x['total_return'], reverse=True)
+    order = np.argsort(-stats.total_return, kind='stable')
     
     print(f"{'策略':<15} {'交易':<6} {'胜率':<8} {'总收益率':<10} {'平均收益':<10} {'总盈亏':<10} {'持仓时间':<8}")
     print("-" * 80)
     
-    for stats in strategy_stats:
-        print(f"{stats['strategy']:<15} "
-              f"{stats['trades']:<6} "
-              f"{stats['win_rate']:<8.1%} "
-              f"{stats['total_return']:<10.2%} "
-              f"{stats['avg_return']:<10.2%} "
-              f"${stats['total_value']:<9.0f} "
-              f"{stats['avg_holding']:<8.1f}h")
+    lines = [f"{stats.names[i]:<15} "
+             f"{stats.trades[i]:<6} "
+             f"{win_rate[i]:<8.1%} "
+             f"{stats.total_return[i]:<10.2%} "
+             f"{avg_return[i]:<10.2%} "
+             f"${stats.total_value[i]:<9.0f} "
+             f"{avg_holding[i]:<8.1f}h"
+             for i in order]
+    print("\n".join(lines))
 
-def analyze_exit_reasons(trades_df):
+def analyze_exit_reasons(sell_arrays):
     """分析退出原因"""
+    import numpy as np
+    
     print("\n🚪 退出原因分析")
     print("="*60)
     
-    sell_trades = trades_df[trades_df['action'] == 'SELL']
-    if sell_trades.empty:
+    if sell_arrays.n == 0:
         print("❌ 无卖出交易记录")
         return
     
-    # 按退出原因分组
-    exit_reasons = sell_trades['reason'].value_counts()
-    
-    print("退出原因统计:")
-    for reason, count in exit_reasons.items():
-        percentage = count / len(sell_trades) * 100
-        avg_pnl = sell_trades[sell_trades['reason'] == reason]['pnl_pct'].mean()
-        print(f"   {reason}: {count} 次 ({percentage:.1f}%), 平均收益: {avg_pnl:.2%}")
+    # 按退出原因编码聚合（次数和收益合计一次完成）
+    stats = aggregate_by_category(sell_arrays.reason, sell_arrays)
+    avg_pnl = stats.total_return / stats.trades
+    order = np.argsort(-stats.trades, kind='stable')
+    
+    n_sell = sell_arrays.n
+    lines = ["退出原因统计:"]
+    lines.extend(f"   {stats.names[i]}: {stats.trades[i]} 次 ({stats.trades[i] / n_sell * 100:.1f}%), "
+                 f"平均收益: {avg_pnl[i]:.2%}"
+                 for i in order)
+    print("\n".join(lines))
 
-def analyze_symbol_performance(trades_df):
+def analyze_symbol_performance(sell_arrays):
     """分析各币种表现"""
+    import numpy as np
+    
     print("\n🪙 币种表现分析")
     print("="*60)
     
-    sell_trades = trades_df[trades_df['action'] == 'SELL']
-    if sell_trades.empty:
+    if sell_arrays.n == 0:
         print("❌ 无卖出交易记录")
         return
     
-    # 按币种分组
-    symbol_stats = []
-    
-    for symbol in sell_trades['symbol'].unique():
-        symbol_trades = sell_trades[sell_trades['symbol'] == symbol]
-        
-        total_trades = len(symbol_trades)
-        profitable_trades = len(symbol_trades[symbol_trades['pnl_value'] > 0])
-        win_rate = profitable_trades / total_trades if total_trades > 0 else 0
-        
-        total_pnl = symbol_trades['pnl_pct'].sum()
-        total_value = symbol_trades['pnl_value'].sum()
-        
-        symbol_stats.append({
-            'symbol': symbol,
-            'trades': total_trades,
-            'win_rate': win_rate,
-            'total_return': total_pnl,
-            'total_value': total_value
-        })
-    
-    # 排序并显示前10
-    symbol_stats.sort(key=lambda x: x['total_return'], reverse=True)
+    # 按币种编码聚合（np.bincount一次遍历完成各项求和）
+    stats = aggregate_by_category(sell_arrays.symbol, sell_arrays)
+    win_rate = stats.wins / stats.trades
+    
+    # 只取前10（部分选择，无需对全部币种排序）
+    top_n = min(10, len(stats.names))
+    top = np.argpartition(-stats.total_return, top_n - 1)[:top_n]
+    top = top[np.argsort(-stats.total_return[top], kind='stable')]
     
     print(f"{'币种':<12} {'交易次数':<8} {'胜率':<8} {'总收益率':<10} {'总盈亏':<10}")
     print("-" * 55)
     
-    for stats in symbol_stats[:10]:
-        print(f"{stats['symbol']:<12} "
-              f"{stats['trades']:<8} "
-              f"{stats['win_rate']:<8.1%} "
-              f"{stats['total_return']:<10.2%} "
-              f"${stats['total_value']:<9.0f}")
+    lines = [f"{stats.names[i]:<12} "
+             f"{stats.trades[i]:<8} "
+             f"{win_rate[i]:<8.1%} "
+             f"{stats.total_return[i]:<10.2%} "
+             f"${stats.total_value[i]:<9.0f}"
+             for i in top]
+    print("\n".join(lines))
+
+def compute_equity_metrics(values):
+    """在资金数组上一次性计算收益率均值、标准差和最大回撤"""
+    import numpy as np
+    
+    # 最大回撤：相对于此前历史最高点的最大跌幅
+    running_max = np.maximum.accumulate(values)
+    max_drawdown = ((values - running_max) / running_max).min()
+    
+    # 逐期收益率，直接在数组上计算，不回写DataFrame
+    returns = np.diff(values) / values[:-1]
+    mean_return = returns.mean() if len(returns) > 0 else math.nan
+    std_return = returns.std(ddof=1) if len(returns) > 1 else math.nan
+    
+    return mean_return, std_return, max_drawdown
 
 def analyze_portfolio_equity_curve(portfolio_df):
     """分析组合资金曲线"""
     print("\n📈 资金曲线分析")
     print("="*60)
     
-    if portfolio_df.empty:
+    if len(portfolio_df) == 0:
         print("❌ 无组合历史记录")
         return
     
-    portfolio_df['timestamp'] = pd.to_datetime(portfolio_df['timestamp'])
+    values = portfolio_df['total_value'].to_numpy(dtype='float64')
     
-    initial_value = portfolio_df['total_value'].iloc[0]
-    final_value = portfolio_df['total_value'].iloc[-1]
-    max_value = portfolio_df['total_value'].max()
-    min_value = portfolio_df['total_value'].min()
+    initial_value = values[0]
+    final_value = values[-1]
+    max_value = values.max()
+    min_value = values.min()
     
     total_return = (final_value - initial_value) / initial_value
     max_gain = (max_value - initial_value) / initial_value
-    max_drawdown = (min_value - max_value) / max_value
+    mean_return, std_return, max_drawdown = compute_equity_metrics(values)
     
     print(f"初始资金: ${initial_value:,.0f}")
     print(f"最终资金: ${final_value:,.0f}")
@@ -227,51 +351,45 @@ def analyze_portfolio_equity_curve(portfolio_df):
     print(f"最大回撤: {max_drawdown:.2%}")
     
     # 计算夏普比率
-    portfolio_df['returns'] = portfolio_df['total_value'].pct_change()
-    daily_return = portfolio_df['returns'].mean() * 96  # 15分钟 * 96 = 1天
-    daily_vol = portfolio_df['returns'].std() * np.sqrt(96)
+    daily_return = mean_return * 96  # 15分钟 * 96 = 1天
+    daily_vol = std_return * math.sqrt(96)
     
     annual_return = daily_return * 365
-    annual_vol = daily_vol * np.sqrt(365)
+    annual_vol = daily_vol * math.sqrt(365)
     sharpe_ratio = annual_return / annual_vol if annual_vol != 0 else 0
     
     print(f"年化收益率: {annual_return:.2%}")
     print(f"年化波动率: {annual_vol:.2%}")
     print(f"夏普比率: {sharpe_ratio:.2f}")
 
-def generate_summary_report(trades_df, portfolio_df):
+def generate_summary_report(trades_df, portfolio_df, sell_stats, n_buy):
     """生成总结报告"""
     print("\n📋 回测总结报告")
     print("="*60)
     
-    if trades_df.empty or portfolio_df.empty:
+    if len(trades_df) == 0 or len(portfolio_df) == 0:
         print("❌ 数据不完整，无法生成报告")
         return
     
-    # 时间范围
-    start_time = pd.to_datetime(trades_df['timestamp']).min()
-    end_time = pd.to_datetime(trades_df['timestamp']).max()
+    # 时间范围（timestamp已在加载时解析）
+    start_time, end_time = trades_df['timestamp'].agg(['min', 'max'])
     duration_days = (end_time - start_time).days
     
     # 基本统计
-    sell_trades = trades_df[trades_df['action'] == 'SELL']
-    total_signals = len(trades_df[trades_df['action'] == 'BUY'])
+    total_signals = n_buy
     
-    if len(sell_trades) > 0:
-        win_rate = len(sell_trades[sell_trades['pnl_value'] > 0]) / len(sell_trades)
-        avg_return = sell_trades['pnl_pct'].mean()
-    else:
-        win_rate = 0
-        avg_return = 0
+    win_rate = sell_stats.win_rate
+    avg_return = sell_stats.avg_return
     
     # 资金统计
-    initial_capital = portfolio_df['total_value'].iloc[0]
-    final_capital = portfolio_df['total_value'].iloc[-1]
+    values = portfolio_df['total_value'].to_numpy()
+    initial_capital = values[0]
+    final_capital = values[-1]
     total_return = (final_capital - initial_capital) / initial_capital
     
     print(f"⏱️  回测周期: {duration_days} 天 ({start_time.strftime('%Y-%m-%d')} 至 {end_time.strftime('%Y-%m-%d')})")
     print(f"💰 资金变化: ${initial_capital:,.0f} → ${final_capital:,.0f} ({total_return:+.2%})")
-    print(f"📊 交易统计: {total_signals} 次买入信号, {len(sell_trades)} 次卖出")
+    print(f"📊 交易统计: {total_signals} 次买入信号, {sell_stats.n} 次卖出")
     print(f"🎯 策略效果: 胜率 {win_rate:.1%}, 平均收益 {avg_return:+.2%}")
     
     # 策略建议
@@ -296,13 +414,25 @@ def main():
     if trades_df is None or portfolio_df is None:
         return
     
+    if len(trades_df) == 0 or len(portfolio_df) == 0:
+        print("❌ 回测结果为空，跳过分析")
+        return
+    
+    # 买卖方向只判断一次，各项分析复用同一份卖出记录
+    buy_mask = (trades_df['action'] == 'BUY').to_numpy()
+    sell_mask = (trades_df['action'] == 'SELL').to_numpy()
+    sell_trades = trades_df[sell_mask]
+    n_buy = int(buy_mask.sum())
+    sell_arrays = extract_sell_arrays(sell_trades)
+    sell_stats = compute_sell_stats(sell_arrays)
+    
     # 进行各项分析
-    analyze_trading_performance(trades_df)
-    analyze_strategy_performance(trades_df)
-    analyze_exit_reasons(trades_df)
-    analyze_symbol_performance(trades_df)
+    analyze_trading_performance(trades_df, sell_stats, n_buy)
+    analyze_strategy_performance(sell_arrays)
+    analyze_exit_reasons(sell_arrays)
+    analyze_symbol_performance(sell_arrays)
     analyze_portfolio_equity_curve(portfolio_df)
-    generate_summary_report(trades_df, portfolio_df)
+    generate_summary_report(trades_df, portfolio_df, sell_stats, n_buy)
     
     print(f"\n✅ 分析完成!")
 
@@ -9,9 +9,12 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import glob
+import fnmatch
+import hashlib
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
 import warnings
 import json
 import matplotlib.pyplot as plt
@@ -22,6 +25,13 @@ warnings.filterwarnings('ignore')
 # 北京时区
 BEIJING_TZ = pytz.timezone('Asia/Shanghai')
 
+def to_beijing_time_strings(utc_times, fmt='%Y-%m-%d %H:%M:%S'):
+    """批量将UTC时间转换为北京时间字符串（向量化时区转换）"""
+    times = pd.DatetimeIndex(utc_times)
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+    return times.tz_convert(BEIJING_TZ).strftime(fmt)
+
 def to_beijing_time(utc_time):
     """将UTC时间转换为北京时间"""
     if utc_time.tzinfo is None:
@@ -34,8 +44,195 @@ def to_beijing_time(utc_time):
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from monitor.advanced_momentum_strategy import AdvancedMomentumMonitor
+from monitor.volume_breakout_strategy import VolumeBreakoutMonitor
 from utils.log_utils import print_log
 
+# K线价格和成交量列，加载时降为float32以减半内存占用（资金和盈亏计算仍使用float64）
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volumn']
+OHLCV_DTYPE = 'float32'
+
+# 解析缓存的版本号：修改parse_symbol_csv的解析逻辑（时间列、排序等）时加1，使旧缓存失效
+PARSE_CACHE_VERSION = 1
+
+def parse_symbol_csv(file_path):
+    """解析单个币种的K线CSV：解析时间列、价格降为float32、按时间排序"""
+    # 读取时直接解析时间列，数据通常已按时间排好序，无需重复排序
+    df = pd.read_csv(file_path, parse_dates=['openTime'])
+    for col in OHLCV_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(OHLCV_DTYPE)
+    if not df['openTime'].is_monotonic_increasing:
+        df = df.sort_values('openTime')
+    return df
+
+def read_symbol_csv_cached(file_path):
+    """读取K线CSV，解析结果缓存到数据目录下的.cache中
+    
+    缓存以CSV的修改时间、大小和解析设置的哈希为键，CSV或解析设置变化后重新解析并清理旧缓存。
+    注意：.cache中保存了每个数据文件解析后的完整副本，会额外占用与数据目录相当的磁盘空间。
+    """
+    stat = os.stat(file_path)
+    cache_dir = os.path.join(os.path.dirname(file_path), '.cache')
+    cache_prefix = os.path.basename(file_path) + '.'
+    spec = repr((PARSE_CACHE_VERSION, OHLCV_COLUMNS, OHLCV_DTYPE))
+    cache_name = f"{cache_prefix}{stat.st_mtime_ns}_{stat.st_size}_{hashlib.md5(spec.encode()).hexdigest()[:8]}.pkl"
+    cache_path = os.path.join(cache_dir, cache_name)
+    
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"⚠️  读取缓存失败 {cache_name}: {e}")
+    
+    df = parse_symbol_csv(file_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 只清理已写完的旧缓存，其他进程正在写入的.tmp文件不能删除
+        for name in os.listdir(cache_dir):
+            if name.startswith(cache_prefix) and name.endswith('.pkl') and name != cache_name:
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except FileNotFoundError:
+                    pass
+        # 先写临时文件再替换，避免并发运行时读到写了一半的缓存
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  写入缓存失败 {cache_name}: {e}")
+    return df
+
+def load_symbol_csv(file_path, start_date=None, end_date=None):
+    """读取单个币种的K线数据并按时间过滤（在子进程中执行）"""
+    df = read_symbol_csv_cached(file_path)
+    
+    # 时间过滤
+    if start_date:
+        df = df[df['openTime'] >= start_date]
+    if end_date:
+        df = df[df['openTime'] <= end_date]
+    
+    return df
+
+def aggregate_symbol_bars(df, timeframe):
+    """对单个币种的完整K线只做一次周期聚合，供成交量突破检测按窗口切片复用（在子进程中执行）
+    
+    聚合按行索引标签分组（与VolumeBreakoutMonitor.aggregate_to_timeframe一致），
+    只有行索引连续的币种才能直接切片，其余币种返回None，检测时仍按窗口重新聚合。
+    返回：(完整分组编号数组, 行索引起始标签, 聚合后的K线DataFrame)
+    """
+    monitor = VolumeBreakoutMonitor(timeframe=timeframe)
+    periods = monitor.periods_per_timeframe
+    labels = df.index.to_numpy()
+    if periods == 1 or len(labels) == 0 or not np.all(np.diff(labels) == 1):
+        return None
+    
+    groups, counts = np.unique(labels // periods, return_counts=True)
+    complete_groups = groups[counts == periods]
+    aggregated_df = monitor.aggregate_to_timeframe(df)
+    if len(aggregated_df) != len(complete_groups):
+        return None
+    return complete_groups, labels[0], aggregated_df
+
+def load_symbol_data(file_path, start_date, end_date, timeframe):
+    """读取单个币种的K线并完成逐币种的预计算（在子进程中执行）"""
+    df = load_symbol_csv(file_path, start_date, end_date)
+    return df, aggregate_symbol_bars(df, timeframe)
+
+def iter_loaded_symbols(load_tasks, start_date, end_date, timeframe, max_workers=None):
+    """按任务顺序逐个产出(币种, load_symbol_data结果, 异常)
+    
+    max_workers为1时在当前进程串行解析（已在子进程中运行时避免再开进程池），否则多进程并行解析。
+    """
+    if max_workers == 1:
+        for symbol, file_path in load_tasks:
+            try:
+                yield symbol, load_symbol_data(file_path, start_date, end_date, timeframe), None
+            except Exception as e:
+                yield symbol, None, e
+        return
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(load_symbol_data, file_path, start_date, end_date, timeframe)
+                   for _, file_path in load_tasks]
+        for (symbol, _), future in zip(load_tasks, futures):
+            try:
+                yield symbol, future.result(), None
+            except Exception as e:
+                yield symbol, None, e
+
+def rolling_window_mean(values, window):
+    """计算以每根K线结尾的滑动窗口均值（与对窗口切片取mean()结果一致），窗口不足处为NaN"""
+    out = np.full(len(values), np.nan, dtype=values.dtype)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return out
+
+def rolling_window_max(values, window):
+    """计算以每根K线结尾的滑动窗口最大值，窗口不足处为NaN"""
+    out = np.full(len(values), np.nan, dtype=values.dtype)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).max(axis=1)
+    return out
+
+def period_return(close, period):
+    """计算close[k] / close[k-period+1] - 1（与信号检测中iloc[-1]/iloc[-period]的算法一致），不足处为NaN"""
+    out = np.full(len(close), np.nan, dtype=close.dtype)
+    if len(close) >= period:
+        out[period - 1:] = close[period - 1:] / close[:len(close) - period + 1] - 1
+    return out
+
+# 持仓退出代码：0=继续持有，1=止损，2=最高止盈，3=移动止盈，4-7=时间退出
+EXIT_HOLD = 0
+EXIT_STOP_LOSS = 1
+EXIT_MAX_PROFIT = 2
+EXIT_TRAILING_STOP = 3
+EXIT_TIME_PROFIT = 4
+EXIT_TIME_LOSS = 5
+EXIT_FORCE_PROFIT = 6
+EXIT_FORCE_LOSS = 7
+
+def position_exit_kernel(current_prices, entry_price, max_profit, max_loss, max_price,
+                         trailing_stop_price, trailing_activated, trailing_ratio,
+                         holding_hours, stop_loss_pct, max_profit_pct):
+    """持仓更新与退出判断内核（纯数组运算）
+    
+    原地更新max_profit、max_loss、max_price、trailing_stop_price、trailing_activated，
+    返回 (未实现盈亏数组, int8退出代码数组)。
+    """
+    # 未实现盈亏、最大盈利/亏损
+    pnl = (current_prices - entry_price) / entry_price
+    np.maximum(max_profit, pnl, out=max_profit)
+    np.minimum(max_loss, pnl, out=max_loss)
+    
+    # 移动止盈：更新最高价，盈利达到20%时激活，止盈价只能向上调整
+    np.maximum(max_price, current_prices, out=max_price)
+    activate = ((max_price - entry_price) / entry_price >= 0.20) & ~trailing_activated
+    trailing_stop_price[activate] = entry_price[activate] * 1.15
+    trailing_activated |= activate
+    new_trailing_stop = max_price * trailing_ratio
+    raise_stop = trailing_activated & (new_trailing_stop > trailing_stop_price)
+    trailing_stop_price[raise_stop] = new_trailing_stop[raise_stop]
+    
+    # 退出规则按优先级排列：时间退出 > 止损 > 最高止盈 > 移动止盈
+    exit_code = np.select(
+        [
+            (holding_hours >= 72) & (pnl >= 0.10),
+            (holding_hours >= 168) & (pnl >= 0.03),
+            (holding_hours >= 240) & (pnl <= -0.03),
+            (holding_hours >= 336) & (pnl > 0),
+            holding_hours >= 336,
+            pnl <= stop_loss_pct,
+            pnl >= max_profit_pct,
+            trailing_activated & (current_prices <= trailing_stop_price),
+        ],
+        [EXIT_TIME_PROFIT, EXIT_TIME_PROFIT, EXIT_TIME_LOSS, EXIT_FORCE_PROFIT,
+         EXIT_FORCE_LOSS, EXIT_STOP_LOSS, EXIT_MAX_PROFIT, EXIT_TRAILING_STOP],
+        default=EXIT_HOLD,
+    ).astype(np.int8)
+    
+    return pnl, exit_code
+
 class Position:
     """单个持仓"""
     def __init__(self, symbol, entry_price, quantity, entry_time, strategy_type, open_price=None):
@@ -43,6 +240,7 @@ class Position:
         self.entry_price = entry_price
         self.quantity = quantity
         self.entry_time = entry_time
+        self.entry_time_i8 = pd.Timestamp(entry_time).value  # 纳秒时间戳，用于快速计算持有时间
         self.strategy_type = strategy_type
         self.current_price = entry_price
         self.unrealized_pnl = 0
@@ -109,19 +307,7 @@ class Position:
     
     def get_holding_hours(self, current_time):
         """获取持有时间（小时）"""
-        from datetime import datetime
-        if isinstance(self.entry_time, str):
-            entry_dt = datetime.fromisoformat(self.entry_time)
-        else:
-            entry_dt = self.entry_time
-            
-        if isinstance(current_time, str):
-            current_dt = datetime.fromisoformat(current_time)
-        else:
-            current_dt = current_time
-            
-        time_diff = current_dt - entry_dt
-        return time_diff.total_seconds() / 3600
+        return (pd.Timestamp(current_time).value - self.entry_time_i8) / 3.6e12
     
     def should_time_exit(self, current_time):
         """判断是否应该基于时间退出
@@ -156,16 +342,40 @@ class Position:
         
         return None
 
+# 交易记录字段（与交易记录DataFrame的列顺序一致）
+TRADE_ACTIONS = ('BUY', 'SELL')
+BUY_TRADE_FIELDS = ['timestamp', 'beijing_time', 'symbol', 'action', 'price', 'quantity', 'value',
+                    'strategy', 'signal_strength', 'buy_strategy', 'original_signal_price']
+SELL_TRADE_FIELDS = ['timestamp', 'beijing_time', 'symbol', 'action', 'price', 'quantity', 'value',
+                     'strategy', 'pnl_pct', 'pnl_value', 'holding_period', 'reason', 'max_profit', 'max_loss']
+TRADE_FLOAT_FIELDS = ['price', 'quantity', 'value', 'signal_strength', 'original_signal_price',
+                      'pnl_pct', 'pnl_value', 'holding_period', 'max_profit', 'max_loss']
+TRADE_LABEL_FIELDS = ['symbol', 'strategy', 'buy_strategy']
+TRADE_INITIAL_CAPACITY = 256
+
+# 组合历史字段（与组合历史DataFrame的列顺序一致）
+PORTFOLIO_HISTORY_FIELDS = ['timestamp', 'total_value', 'cash', 'position_value', 'position_count', 'exposure']
+PORTFOLIO_HISTORY_DTYPES = {'timestamp': 'i8', 'total_value': 'f8', 'cash': 'f8',
+                            'position_value': 'f8', 'position_count': 'i8', 'exposure': 'f8'}
+PORTFOLIO_HISTORY_INITIAL_CAPACITY = 1024
+
 class Portfolio:
     """投资组合管理"""
     def __init__(self, initial_capital=100000, buy_strategy="close"):
         self.initial_capital = initial_capital
         self.cash = initial_capital
         self.positions = {}  # symbol -> Position
-        self.trade_history = []
-        self.portfolio_history = []
         self.daily_returns = []
         
+        # 组合历史按列存储在预分配数组中（时间为int64纳秒），报告时再生成DataFrame
+        self._history_n = 0
+        self._history_cols = {field: np.empty(PORTFOLIO_HISTORY_INITIAL_CAPACITY, dtype=dtype)
+                              for field, dtype in PORTFOLIO_HISTORY_DTYPES.items()}
+        
+        # 持仓市值缓存，持仓或价格变化时置为失效
+        self._position_value = 0.0
+        self._position_value_dirty = False
+        
         # 风险控制参数
         self.max_position_pct = 0.15 # 单个币种最大仓位比例
         self.max_total_exposure = 1.0  # 最大总仓位比例
@@ -176,24 +386,150 @@ class Portfolio:
         self.buy_strategy = buy_strategy  # "close" 或 "golden_ratio"
         self.golden_ratio = 0.618  # 黄金分割比例
         
+        # 交易记录按列存储在预分配数组中，字符串字段存为标签索引，报告时再生成DataFrame
+        self._trade_n = 0
+        self._trade_cols = {
+            'timestamp': np.empty(TRADE_INITIAL_CAPACITY, dtype='i8'),
+            'action': np.empty(TRADE_INITIAL_CAPACITY, dtype='i1'),  # 0=BUY, 1=SELL
+        }
+        for field in TRADE_LABEL_FIELDS:
+            self._trade_cols[field] = np.empty(TRADE_INITIAL_CAPACITY, dtype='i4')
+        for field in TRADE_FLOAT_FIELDS:
+            self._trade_cols[field] = np.empty(TRADE_INITIAL_CAPACITY, dtype='f8')
+        self._trade_reasons = []  # 卖出原因（买入记录为None）
+        self._trade_labels = []  # 标签索引 -> 字符串
+        self._trade_label_idx = {}  # 字符串 -> 标签索引
+        
+    def _label_index(self, label):
+        """获取字符串标签的索引（首次出现时登记）"""
+        idx = self._trade_label_idx.get(label)
+        if idx is None:
+            idx = len(self._trade_labels)
+            self._trade_labels.append(label)
+            self._trade_label_idx[label] = idx
+        return idx
+    
+    def _record_trade(self, timestamp, action, symbol, strategy, buy_strategy=None, reason=None, **values):
+        """追加一条交易记录到列式缓冲区，容量不足时按2倍扩容"""
+        n = self._trade_n
+        cols = self._trade_cols
+        if n == len(cols['timestamp']):
+            for field, arr in cols.items():
+                cols[field] = np.resize(arr, 2 * len(arr))
+        
+        cols['timestamp'][n] = pd.Timestamp(timestamp).value
+        cols['action'][n] = TRADE_ACTIONS.index(action)
+        cols['symbol'][n] = self._label_index(symbol)
+        cols['strategy'][n] = self._label_index(strategy)
+        cols['buy_strategy'][n] = -1 if buy_strategy is None else self._label_index(buy_strategy)
+        for field in TRADE_FLOAT_FIELDS:
+            cols[field][n] = values.get(field, np.nan)
+        self._trade_reasons.append(reason)
+        self._trade_n = n + 1
+    
+    @property
+    def trade_history(self):
+        """交易记录列表（每笔交易一个dict，按需从列式缓冲区生成）"""
+        n = self._trade_n
+        cols = {field: arr[:n].tolist() for field, arr in self._trade_cols.items()}
+        labels = self._trade_labels
+        timestamps = pd.to_datetime(self._trade_cols['timestamp'][:n])
+        beijing_times = to_beijing_time_strings(timestamps)
+        trades = []
+        for i in range(n):
+            row = {
+                'timestamp': timestamps[i],
+                'beijing_time': beijing_times[i],
+                'symbol': labels[cols['symbol'][i]],
+                'action': TRADE_ACTIONS[cols['action'][i]],
+                'strategy': labels[cols['strategy'][i]],
+            }
+            if cols['action'][i] == 0:
+                row['buy_strategy'] = labels[cols['buy_strategy'][i]]
+                fields = BUY_TRADE_FIELDS
+            else:
+                row['reason'] = self._trade_reasons[i]
+                fields = SELL_TRADE_FIELDS
+            trades.append({field: row[field] if field in row else cols[field][i] for field in fields})
+        return trades
+    
+    def get_trades_df(self):
+        """将交易记录整理为DataFrame（列顺序与交易记录列表一致）"""
+        n = self._trade_n
+        if n == 0:
+            return pd.DataFrame()
+        
+        cols = {field: arr[:n] for field, arr in self._trade_cols.items()}
+        labels = np.array(self._trade_labels + [np.nan], dtype=object)  # 索引-1对应NaN
+        is_buy = cols['action'] == 0
+        timestamps = pd.to_datetime(cols['timestamp'])
+        
+        data = {
+            'timestamp': timestamps,
+            'beijing_time': to_beijing_time_strings(timestamps),
+            'symbol': labels[cols['symbol']],
+            'action': np.array(TRADE_ACTIONS, dtype=object)[cols['action']],
+            'strategy': labels[cols['strategy']],
+            'buy_strategy': labels[cols['buy_strategy']],
+            'reason': np.array(self._trade_reasons, dtype=object),
+        }
+        data['reason'][is_buy] = np.nan
+        for field in TRADE_FLOAT_FIELDS:
+            data[field] = cols[field]
+        
+        # 列顺序按首笔交易的类型确定，另一类交易独有的字段依次追加在后
+        first, other = (BUY_TRADE_FIELDS, SELL_TRADE_FIELDS) if is_buy[0] else (SELL_TRADE_FIELDS, BUY_TRADE_FIELDS)
+        columns = first + [field for field in other if field not in first]
+        return pd.DataFrame({field: data[field] for field in columns})
+    
+    @property
+    def portfolio_history(self):
+        """组合历史列表（每个时间点一个dict，按需从列式缓冲区生成）"""
+        n = self._history_n
+        cols = {field: arr[:n].tolist() for field, arr in self._history_cols.items()}
+        cols['timestamp'] = list(pd.to_datetime(self._history_cols['timestamp'][:n]))
+        return [dict(zip(PORTFOLIO_HISTORY_FIELDS, row)) for row in zip(*(cols[field] for field in PORTFOLIO_HISTORY_FIELDS))]
+    
+    def get_portfolio_history_len(self):
+        """已记录的组合历史条数"""
+        return self._history_n
+    
+    def get_portfolio_history_df(self):
+        """将组合历史整理为DataFrame（timestamp列为datetime64）"""
+        n = self._history_n
+        if n == 0:
+            return pd.DataFrame()
+        
+        data = {field: self._history_cols[field][:n].copy() for field in PORTFOLIO_HISTORY_FIELDS}
+        data['timestamp'] = pd.to_datetime(data['timestamp'])
+        return pd.DataFrame(data)
+    
+    def get_position_value(self):
+        """获取持仓总市值（缓存，开平仓或更新价格后才重新计算）"""
+        if self._position_value_dirty:
+            self._position_value = sum(pos.get_market_value() for pos in self.positions.values())
+            self._position_value_dirty = False
+        return self._position_value
+    
     def get_total_value(self):
         """获取总资产价值"""
-        total_position_value = sum(pos.get_market_value() for pos in self.positions.values())
-        return self.cash + total_position_value
+        return self.cash + self.get_position_value()
     
     def get_position_exposure(self):
         """获取总仓位暴露度"""
         total_value = self.get_total_value()
         if total_value <= 0:
             return 0
-        total_position_value = sum(pos.get_market_value() for pos in self.positions.values())
-        return total_position_value / total_value
+        return self.get_position_value() / total_value
     
     def can_open_position(self, symbol, entry_price, signal_strength):
-        """检查是否可以开仓"""
+        """检查是否可以开仓
+        
+        返回：(can_open, reason, position_size)，不可开仓时position_size为0
+        """
         # 检查是否已有该币种持仓
         if symbol in self.positions:
-            return False, "已持有该币种"
+            return False, "已持有该币种", 0.0
         
         # 计算建议仓位大小（基于信号强度）
         position_size = self.calculate_position_size(entry_price, signal_strength)
@@ -201,16 +537,22 @@ class Portfolio:
         # 检查现金是否充足
         required_cash = position_size * entry_price
         if required_cash > self.cash:
-            return False, "现金不足"
+            return False, "现金不足", 0.0
         
         # 检查总仓位限制
         current_exposure = self.get_position_exposure()
         new_exposure = required_cash / self.get_total_value()
         
         if current_exposure + new_exposure > self.max_total_exposure:
-            return False, "总仓位超限"
+            return False, "总仓位超限", 0.0
         
-        return True, "可以开仓"
+        return True, "可以开仓", position_size
+    
+    def has_capacity_for_new_position(self):
+        """判断是否还有开新仓的余地（无现金或总仓位已达上限时，任何正仓位都无法通过can_open_position）"""
+        if self.cash <= 0:
+            return False
+        return self.get_position_exposure() < self.max_total_exposure
     
     def calculate_position_size(self, entry_price, signal_strength):
         """计算仓位大小"""
@@ -271,11 +613,10 @@ class Portfolio:
             else:
                 return False, f"黄金分割点挂单无法成交：信号价{entry_price:.6f}，下根K线低点{next_low_price:.6f}"
         
-        can_open, reason = self.can_open_position(symbol, actual_buy_price, signal_strength)
+        can_open, reason, quantity = self.can_open_position(symbol, actual_buy_price, signal_strength)
         if not can_open:
             return False, reason
         
-        quantity = self.calculate_position_size(actual_buy_price, signal_strength)
         cost = quantity * actual_buy_price
         
         # 扣除现金
@@ -284,22 +625,18 @@ class Portfolio:
         # 创建持仓
         position = Position(symbol, actual_buy_price, quantity, entry_time, strategy_type)
         self.positions[symbol] = position
+        self._position_value_dirty = True
         
         # 记录交易
-        trade = {
-            'timestamp': entry_time,
-            'beijing_time': to_beijing_time(entry_time).strftime('%Y-%m-%d %H:%M:%S'),
-            'symbol': symbol,
-            'action': 'BUY',
-            'price': actual_buy_price,
-            'quantity': quantity,
-            'value': cost,
-            'strategy': strategy_type,
-            'signal_strength': signal_strength,
-            'buy_strategy': self.buy_strategy,  # 记录使用的买入策略
-            'original_signal_price': entry_price  # 记录原始信号价格
-        }
-        self.trade_history.append(trade)
+        self._record_trade(
+            entry_time, 'BUY', symbol, strategy_type,
+            buy_strategy=self.buy_strategy,  # 记录使用的买入策略
+            price=actual_buy_price,
+            quantity=quantity,
+            value=cost,
+            signal_strength=signal_strength,
+            original_signal_price=entry_price  # 记录原始信号价格
+        )
         
         return True, "开仓成功"
     
@@ -319,67 +656,100 @@ class Portfolio:
         pnl_value = proceeds - position.get_cost_value()
         
         # 记录交易
-        trade = {
-            'timestamp': exit_time,
-            'beijing_time': to_beijing_time(exit_time).strftime('%Y-%m-%d %H:%M:%S'),
-            'symbol': symbol,
-            'action': 'SELL',
-            'price': exit_price,
-            'quantity': position.quantity,
-            'value': proceeds,
-            'strategy': position.strategy_type,
-            'pnl_pct': pnl_pct,
-            'pnl_value': pnl_value,
-            'holding_period': (exit_time - position.entry_time).total_seconds() / 3600,  # 小时
-            'reason': reason,
-            'max_profit': position.max_profit,
-            'max_loss': position.max_loss
-        }
-        self.trade_history.append(trade)
+        self._record_trade(
+            exit_time, 'SELL', symbol, position.strategy_type,
+            reason=reason,
+            price=exit_price,
+            quantity=position.quantity,
+            value=proceeds,
+            pnl_pct=pnl_pct,
+            pnl_value=pnl_value,
+            holding_period=(exit_time - position.entry_time).total_seconds() / 3600,  # 小时
+            max_profit=position.max_profit,
+            max_loss=position.max_loss
+        )
         
         # 删除持仓
         del self.positions[symbol]
+        self._position_value_dirty = True
         
         return True, "平仓成功"
     
     def update_positions(self, price_data, current_time):
-        """更新所有持仓"""
-        for symbol in list(self.positions.keys()):
-            if symbol in price_data:
-                current_price = price_data[symbol]
-                position = self.positions[symbol]
-                position.update_price(current_price)
-                
-                # 检查持有时间退出策略
-                holding_hours = position.get_holding_hours(current_time)
-                time_exit_reason = position.should_time_exit(current_time)
-                if time_exit_reason:
-                    self.close_position(symbol, current_price, current_time, time_exit_reason)
-                # 检查止损：-8%
-                elif position.unrealized_pnl <= self.stop_loss_pct:
-                    self.close_position(symbol, current_price, current_time, "止损（-8%）")
-                # 检查最高止盈：80%
-                elif position.unrealized_pnl >= self.max_profit_pct:
-                    self.close_position(symbol, current_price, current_time, "止盈（80%）")
-                # 检查移动止盈
-                elif position.should_trailing_stop():
-                    profit_pct = position.unrealized_pnl
-                    self.close_position(symbol, current_price, current_time, f"移动止盈（{profit_pct:.1%}）")
+        """更新所有持仓（将持仓展开为数组，一次性向量化计算盈亏和退出条件）"""
+        symbols = [symbol for symbol in self.positions if symbol in price_data]
+        if not symbols:
+            self._position_value_dirty = True
+            return
+        
+        positions = [self.positions[symbol] for symbol in symbols]
+        current_prices = np.array([price_data[symbol] for symbol in symbols], dtype=np.float64)
+        entry_price = np.array([p.entry_price for p in positions], dtype=np.float64)
+        max_profit = np.array([p.max_profit for p in positions], dtype=np.float64)
+        max_loss = np.array([p.max_loss for p in positions], dtype=np.float64)
+        max_price = np.array([p.max_price for p in positions], dtype=np.float64)
+        trailing_stop_price = np.array([p.trailing_stop_price for p in positions], dtype=np.float64)
+        trailing_activated = np.array([p.trailing_stop_activated for p in positions], dtype=bool)
+        trailing_ratio = np.array([p.trailing_stop_ratio for p in positions], dtype=np.float64)
+        entry_time_i8 = np.array([p.entry_time_i8 for p in positions], dtype=np.int64)
+        now_i8 = pd.Timestamp(current_time).value
+        holding_hours = (now_i8 - entry_time_i8) / 3.6e12
+        
+        pnl, exit_code = position_exit_kernel(
+            current_prices, entry_price, max_profit, max_loss, max_price,
+            trailing_stop_price, trailing_activated, trailing_ratio,
+            holding_hours, self.stop_loss_pct, self.max_profit_pct)
+        
+        # 回写持仓状态
+        for i, position in enumerate(positions):
+            position.current_price = price_data[symbols[i]]
+            position.unrealized_pnl = pnl[i]
+            position.max_profit = max_profit[i]
+            position.max_loss = max_loss[i]
+            position.max_price = max_price[i]
+            position.trailing_stop_activated = bool(trailing_activated[i])
+            position.trailing_stop_price = trailing_stop_price[i]
+        
+        # 按持仓顺序平仓
+        for i in np.flatnonzero(exit_code):
+            symbol = symbols[i]
+            code = exit_code[i]
+            profit_pct = pnl[i]
+            hours = holding_hours[i]
+            if code == EXIT_TIME_PROFIT:
+                reason = f"时间止盈（持有{hours:.0f}h，盈利{profit_pct:.1%}）"
+            elif code == EXIT_TIME_LOSS:
+                reason = f"时间止损（持有{hours:.0f}h，亏损{profit_pct:.1%}）"
+            elif code == EXIT_FORCE_PROFIT:
+                reason = f"强制止盈（持有{hours:.0f}h，盈利{profit_pct:.1%}）"
+            elif code == EXIT_FORCE_LOSS:
+                reason = f"强制止损（持有{hours:.0f}h，亏损{profit_pct:.1%}）"
+            elif code == EXIT_STOP_LOSS:
+                reason = "止损（-8%）"
+            elif code == EXIT_MAX_PROFIT:
+                reason = "止盈（80%）"
+            else:
+                reason = f"移动止盈（{profit_pct:.1%}）"
+            self.close_position(symbol, price_data[symbol], current_time, reason)
+        
+        # 持仓价格已更新，市值缓存失效
+        self._position_value_dirty = True
     
     def record_portfolio_value(self, timestamp):
-        """记录组合价值"""
-        total_value = self.get_total_value()
-        position_value = sum(pos.get_market_value() for pos in self.positions.values())
-        
-        portfolio_record = {
-            'timestamp': timestamp,
-            'total_value': total_value,
-            'cash': self.cash,
-            'position_value': position_value,
-            'position_count': len(self.positions),
-            'exposure': self.get_position_exposure()
-        }
-        self.portfolio_history.append(portfolio_record)
+        """记录组合价值（追加到列式缓冲区，容量不足时按2倍扩容）"""
+        n = self._history_n
+        cols = self._history_cols
+        if n == len(cols['timestamp']):
+            for field, arr in cols.items():
+                cols[field] = np.resize(arr, 2 * len(arr))
+        
+        cols['timestamp'][n] = pd.Timestamp(timestamp).value
+        cols['total_value'][n] = self.get_total_value()
+        cols['cash'][n] = self.cash
+        cols['position_value'][n] = self.get_position_value()
+        cols['position_count'][n] = len(self.positions)
+        cols['exposure'][n] = self.get_position_exposure()
+        self._history_n = n + 1
 
 class MomentumBacktest:
     """动量策略回测引擎"""
@@ -389,51 +759,80 @@ class MomentumBacktest:
         self.portfolio = Portfolio(initial_capital)
         self.momentum_monitor = AdvancedMomentumMonitor(data_dir=data_dir)
         
+        # 成交量突破检测器：复用同一实例，每次检测前写入预先聚合好的K线作为缓存
+        self.breakout_monitor = VolumeBreakoutMonitor(volume_multiplier=self.momentum_monitor.volume_multiplier)
+        self.aggregated_bars = {}  # symbol -> (完整分组编号数组, 行索引起始标签, 聚合后的K线DataFrame)
+        
         # 回测参数
         self.lookback_window = 500  # 计算信号所需的历史数据窗口
+        self.load_workers = None  # 加载数据的进程数，None为CPU核数，1为当前进程串行加载
         self.rebalance_frequency = 4  # 每4个15分钟重新评估一次（1小时）
         
         # 数据存储
         self.all_data = {}
+        self.arr_data = {}  # symbol -> 预先提取的NumPy数组，用于按时间二分查找
         self.timestamps = []
         
+        # 按统一时间索引对齐的收盘价矩阵（行：时间点，列：币种）
+        self.symbols = []
+        self.ts_to_idx = {}
+        self.sym_to_idx = {}
+        self.close_mat = None
+        self.bar_idx_mat = None  # 每个时间点各币种最后一根K线的位置（尚无数据为-1）
+        
+        # 截面信号特征矩阵（行：时间点，列：币种），加载数据后一次性计算
+        self.signal_features = {}
+        
+        # 信号计算时复用的价格数据dict，每次只替换当前币种
+        self.signal_price_data = {}
+        self.signal_symbol = None
+        
     def load_historical_data(self, start_date=None, end_date=None, symbols=None):
         """加载历史数据"""
         print("📊 加载历史数据...")
         
-        # 获取所有数据文件
-        pattern = f"{self.data_dir}/*_15m_*.csv"
-        files = glob.glob(pattern)
+        # 获取所有数据文件：一次遍历目录，文件名匹配和文件大小都取自目录项
+        files = []
+        if os.path.isdir(self.data_dir):
+            with os.scandir(self.data_dir) as entries:
+                files = [(entry.path, entry.name, entry.stat().st_size) for entry in entries
+                         if fnmatch.fnmatch(entry.name, '*_15m_*.csv') and not entry.name.startswith('.')]
         
-        loaded_count = 0
-        for file_path in files:
-            if os.path.getsize(file_path) < 1000:
+        load_tasks = []
+        for file_path, filename, file_size in files:
+            if file_size < 1000:
                 continue
-                
-            filename = os.path.basename(file_path)
+            
             symbol = filename.split('_')[0]
             
             # 如果指定了符号列表，只加载指定的符号
             if symbols and symbol not in symbols:
                 continue
             
-            try:
-                df = pd.read_csv(file_path)
-                df['openTime'] = pd.to_datetime(df['openTime'])
-                df = df.sort_values('openTime')
-                
-                # 时间过滤
-                if start_date:
-                    df = df[df['openTime'] >= start_date]
-                if end_date:
-                    df = df[df['openTime'] <= end_date]
-                
-                if len(df) > self.lookback_window:
-                    self.all_data[symbol] = df
-                    loaded_count += 1
-                    
-            except Exception as e:
-                print(f"⚠️  加载{symbol}数据失败: {str(e)}")
+            load_tasks.append((symbol, file_path))
+        
+        # 多进程并行解析CSV并完成逐币种的周期聚合，结果按文件顺序收集，保证币种顺序与串行加载一致
+        loaded_count = 0
+        timeframe = self.breakout_monitor.timeframe
+        for symbol, result, error in iter_loaded_symbols(load_tasks, start_date, end_date, timeframe, self.load_workers):
+            if error is not None:
+                print(f"⚠️  加载{symbol}数据失败: {str(error)}")
+                continue
+            
+            df, aggregated = result
+            if len(df) > self.lookback_window:
+                self.all_data[symbol] = df
+                if aggregated is not None:
+                    self.aggregated_bars[symbol] = aggregated
+                self.arr_data[symbol] = {
+                    't': df['openTime'].to_numpy(dtype='datetime64[ns]').view('i8'),
+                    'open': df['open'].to_numpy(),
+                    'high': df['high'].to_numpy(),
+                    'low': df['low'].to_numpy(),
+                    'close': df['close'].to_numpy(),
+                    'volumn': df['volumn'].to_numpy()
+                }
+                loaded_count += 1
         
         print(f"✅ 成功加载 {loaded_count} 个币种的数据")
         
@@ -442,50 +841,212 @@ class MomentumBacktest:
         
     def create_time_index(self):
         """创建统一的时间索引"""
-        all_timestamps = set()
-        for symbol_data in self.all_data.values():
-            all_timestamps.update(symbol_data['openTime'].tolist())
-        
-        self.timestamps = sorted(list(all_timestamps))
+        # 在DatetimeIndex上做并集（结果已去重并排序），避免逐个生成Python时间对象
+        time_index = reduce(lambda a, b: a.union(b),
+                            (pd.DatetimeIndex(df['openTime']) for df in self.all_data.values()))
+        self.timestamps = time_index.unique().to_list()
         print(f"📅 回测时间范围: {self.timestamps[0]} 到 {self.timestamps[-1]}")
         print(f"⏱️  总计 {len(self.timestamps)} 个时间点")
+        
+        self.build_price_matrix()
+    
+    def build_price_matrix(self):
+        """把各币种收盘价对齐到统一时间索引，取某时间点全部价格只需读取一行"""
+        self.symbols = list(self.arr_data.keys())
+        self.sym_to_idx = {symbol: j for j, symbol in enumerate(self.symbols)}
+        self.ts_to_idx = {ts: i for i, ts in enumerate(self.timestamps)}
+        
+        time_i8 = pd.DatetimeIndex(self.timestamps).to_numpy(dtype='datetime64[ns]').view('i8')
+        self.close_mat = np.full((len(self.timestamps), len(self.symbols)), np.nan)
+        self.bar_idx_mat = np.full((len(self.timestamps), len(self.symbols)), -1, dtype=np.int64)
+        for j, symbol in enumerate(self.symbols):
+            arrays = self.arr_data[symbol]
+            # 每个时间点取该时间（含）之前的最后一根K线，尚无数据的位置保持NaN
+            idx = np.searchsorted(arrays['t'], time_i8, side='right') - 1
+            has_data = idx >= 0
+            self.close_mat[has_data, j] = arrays['close'][idx[has_data]]
+            self.bar_idx_mat[:, j] = idx
+        
+        self.build_signal_features()
+    
+    def build_signal_features(self):
+        """一次性计算多时间框架共振和突破回踩信号所需的特征，并对齐为（时间点×币种）矩阵
+        
+        每根K线上的特征与AdvancedMomentumMonitor对以该K线结尾的lookback_window窗口的计算完全一致，
+        信号计算时只需读取当前时间点的一行。
+        """
+        n_ts, n_sym = self.bar_idx_mat.shape
+        names = ['short_up', 'mid_up', 'volume_up', 'rel_strong', 'pullback']
+        features = {name: np.zeros((n_ts, n_sym), dtype=bool) for name in names}
+        features['pullback_ratio'] = np.full((n_ts, n_sym), np.nan, dtype=np.float32)
+        features['recent_high'] = np.full((n_ts, n_sym), np.nan, dtype=np.float32)
+        
+        # BTC基准涨幅：与calculate_relative_strength相同，取BTC完整数据最近14根K线
+        btc_df = self.all_data.get('BTCUSDT')
+        btc_returns = None
+        if btc_df is not None and len(btc_df) >= 14:
+            btc_returns = btc_df['close'].iloc[-1] / btc_df['close'].iloc[-14] - 1
+        
+        for j, symbol in enumerate(self.symbols):
+            arrays = self.arr_data[symbol]
+            close, high, volume = arrays['close'], arrays['high'], arrays['volumn']
+            
+            # 多时间框架共振：5周期涨幅、20周期涨幅、成交量放大、相对BTC强度
+            per_bar = {
+                'short_up': period_return(close, 5) > 0.02,
+                'mid_up': period_return(close, 20) > 0.05,
+                'volume_up': rolling_window_mean(volume, 5) > rolling_window_mean(volume, 50) * 1.5,
+                'rel_strong': (period_return(close, 14) - btc_returns > 0.03) if btc_returns is not None
+                              else np.zeros(len(close), dtype=bool),
+            }
+            
+            # 突破回踩：距20周期高点回调3%-8%且轻微放量（RSI在生成信号时再检查）
+            recent_high = rolling_window_max(high, 20)
+            pullback_ratio = (recent_high - close) / recent_high
+            per_bar['pullback'] = ((pullback_ratio >= 0.03) & (pullback_ratio <= 0.08) &
+                                   (rolling_window_mean(volume, 3) > rolling_window_mean(volume, 20) * 1.2))
+            per_bar['pullback_ratio'] = pullback_ratio
+            per_bar['recent_high'] = recent_high
+            
+            # 对齐到统一时间索引，只保留历史窗口完整的时间点
+            idx = self.bar_idx_mat[:, j]
+            valid = idx + 1 >= self.lookback_window
+            for name, values in per_bar.items():
+                features[name][valid, j] = values[idx[valid]]
+        
+        # 窗口长度不足时对应检测器不会产生信号
+        if self.lookback_window < 50:
+            for name in ('short_up', 'mid_up', 'volume_up', 'rel_strong'):
+                features[name][:] = False
+        if self.lookback_window < 30:
+            features['pullback'][:] = False
+        
+        features['momentum_count'] = (features['short_up'].astype(np.int8) + features['mid_up'] +
+                                      features['volume_up'] + features['rel_strong'])
+        self.signal_features = features
+    
+    def volume_breakout_signal_at(self, symbol, hist_data, end):
+        """检测成交量突破信号（与AdvancedMomentumMonitor.detect_volume_breakout结果一致）
+        
+        hist_data为该币种第end根K线之前的历史窗口，聚合数据直接从预先聚合的结果中切片。
+        """
+        if len(hist_data) < 100:  # 需要足够的历史数据
+            return None
+        
+        monitor = self.breakout_monitor
+        monitor.volume_multiplier = self.momentum_monitor.volume_multiplier
+        entry = self.aggregated_bars.get(symbol)
+        if entry is not None:
+            # 窗口内完整的分组即为[lo, hi)范围内的分组
+            complete_groups, first_label, aggregated_df = entry
+            periods = monitor.periods_per_timeframe
+            start = end - len(hist_data)
+            lo = -(-(start + first_label) // periods)
+            hi = (end + first_label) // periods
+            r0, r1 = np.searchsorted(complete_groups, [lo, hi])
+            monitor.aggregated_data_cache[symbol] = aggregated_df.iloc[r0:r1]
+            monitor.cache_timestamp[symbol] = hist_data['openTime'].iloc[-1]
+        else:
+            monitor.aggregated_data_cache.pop(symbol, None)
+        
+        try:
+            result = monitor.detect_volume_breakout(symbol, hist_data)
+        except Exception as e:
+            return None
+        
+        if result['detected']:
+            return {
+                'type': '成交量突破',
+                'coin': symbol,
+                'strength': result['volume_ratio'],
+                'price': result['current_price'],
+                'details': f"成交量{result['volume_ratio']:.1f}倍突破"
+            }
+        return None
+    
+    def momentum_signal_at(self, row, j, symbol):
+        """从特征矩阵读取多时间框架共振信号（与detect_multi_timeframe_momentum结果一致）"""
+        features = self.signal_features
+        count = int(features['momentum_count'][row, j])
+        if count < 3:  # 至少3个信号共振
+            return None
+        
+        labels = [('short_up', '短期上涨'), ('mid_up', '中期上涨'), ('volume_up', '成交量放大'), ('rel_strong', '相对强势')]
+        signals = [label for name, label in labels if features[name][row, j]]
+        close = self.arr_data[symbol]['close']
+        return {
+            'type': '多时间框架共振',
+            'coin': symbol,
+            'strength': count,
+            'price': close[self.bar_idx_mat[row, j]],
+            'details': f"共振信号: {', '.join(signals)}"
+        }
+    
+    def pullback_signal_at(self, row, j, symbol):
+        """从特征矩阵读取突破回踩信号（与detect_pullback_opportunity结果一致）"""
+        features = self.signal_features
+        if not features['pullback'][row, j]:
+            return None
+        
+        # RSI只使用窗口最前面的15根K线，仅对候选币种计算
+        k = self.bar_idx_mat[row, j]
+        close = self.arr_data[symbol]['close']
+        start = k + 1 - self.lookback_window
+        rsi = self.momentum_monitor.calculate_rsi(close[start:start + 15])
+        if not (rsi and self.momentum_monitor.rsi_oversold <= rsi <= 50):
+            return None
+        
+        pullback_ratio = features['pullback_ratio'][row, j]
+        recent_high = features['recent_high'][row, j]
+        return {
+            'type': '突破回踩',
+            'coin': symbol,
+            'strength': (0.08 - pullback_ratio) * 100,  # 回调越小评分越高
+            'price': close[k],
+            'details': f"从高点{recent_high:.4f}回调{pullback_ratio*100:.1f}%, RSI:{rsi:.1f}"
+        }
+    
+    def count_bars_until(self, symbol, timestamp):
+        """二分查找指定时间点（含）之前的K线数量，openTime已按时间排序"""
+        return int(np.searchsorted(self.arr_data[symbol]['t'], pd.Timestamp(timestamp).value, side='right'))
     
     def get_price_data_at_time(self, timestamp):
         """获取指定时间点的价格数据"""
+        row = self.ts_to_idx.get(timestamp)
+        if row is not None:
+            prices = self.close_mat[row]
+            return {symbol: price for symbol, price in zip(self.symbols, prices) if not np.isnan(price)}
+        
         price_data = {}
-        for symbol, df in self.all_data.items():
+        for symbol, arrays in self.arr_data.items():
             # 找到最接近的时间点数据
-            mask = df['openTime'] <= timestamp
-            if mask.any():
-                latest_data = df[mask].iloc[-1]
-                price_data[symbol] = latest_data['close']
+            i = self.count_bars_until(symbol, timestamp)
+            if i > 0:
+                price_data[symbol] = arrays['close'][i - 1]
         return price_data
     
     def get_open_price_at_time(self, symbol, timestamp):
         """获取指定币种在指定时间的开盘价"""
-        if symbol not in self.all_data:
+        if symbol not in self.arr_data:
             return None
         
-        df = self.all_data[symbol]
         # 找到指定时间的数据
-        mask = df['openTime'] <= timestamp
-        if mask.any():
-            latest_data = df[mask].iloc[-1]
-            return latest_data['open']
+        i = self.count_bars_until(symbol, timestamp)
+        if i > 0:
+            return self.arr_data[symbol]['open'][i - 1]
         
         return None
     
     def get_next_low_price_at_time(self, symbol, current_timestamp):
         """获取指定币种在下一个时间点的最低价"""
-        if symbol not in self.all_data:
+        if symbol not in self.arr_data:
             return None
         
-        df = self.all_data[symbol]
         # 找到当前时间之后的第一根K线
-        mask = df['openTime'] > current_timestamp
-        if mask.any():
-            next_data = df[mask].iloc[0]
-            return next_data['low']
+        i = self.count_bars_until(symbol, current_timestamp)
+        low = self.arr_data[symbol]['low']
+        if i < len(low):
+            return low[i]
         
         return None
     
@@ -494,20 +1055,22 @@ class MomentumBacktest:
         if symbol not in self.all_data:
             return None
         
-        df = self.all_data[symbol]
-        mask = df['openTime'] <= timestamp
-        
-        if mask.sum() < self.lookback_window:
+        i = self.count_bars_until(symbol, timestamp)
+        if i < self.lookback_window:
             return None
         
-        return df[mask].tail(self.lookback_window)
+        # 按位置切片取最近的窗口，无需整列布尔掩码
+        return self.all_data[symbol].iloc[i - self.lookback_window:i]
     
     def calculate_signals_at_time(self, timestamp):
         """计算指定时间点的所有信号"""
         signals = []
+        price_data = self.signal_price_data
+        btc_data = self.all_data.get('BTCUSDT')
+        row = self.ts_to_idx.get(timestamp)  # 不在统一时间索引上时退回逐币种检测
         
         # 为每个币种计算信号
-        for symbol in self.all_data.keys():
+        for j, symbol in enumerate(self.symbols):
             if symbol == 'BTCUSDT':  # 跳过BTC作为基准
                 continue
             
@@ -515,23 +1078,37 @@ class MomentumBacktest:
             if hist_data is None or len(hist_data) < self.lookback_window:
                 continue
             
-            # 临时设置数据用于信号计算
-            self.momentum_monitor.price_data = {symbol: hist_data, 'BTCUSDT': self.all_data.get('BTCUSDT')}
+            # 临时设置数据用于信号计算：只保留当前币种和BTC
+            if self.signal_symbol is not None and self.signal_symbol != symbol:
+                price_data.pop(self.signal_symbol, None)
+            price_data[symbol] = hist_data
+            price_data['BTCUSDT'] = btc_data
+            self.signal_symbol = symbol
+            self.momentum_monitor.price_data = price_data
             
             # 检测各种信号
             try:
                 # 1. 成交量突破信号
-                volume_signal = self.momentum_monitor.detect_volume_breakout(symbol)
+                if row is not None:
+                    volume_signal = self.volume_breakout_signal_at(symbol, hist_data, self.bar_idx_mat[row, j] + 1)
+                else:
+                    volume_signal = self.momentum_monitor.detect_volume_breakout(symbol)
                 if volume_signal:
                     signals.append(volume_signal)
                 
                 # 2. 多时间框架共振信号
-                momentum_signal = self.momentum_monitor.detect_multi_timeframe_momentum(symbol)
+                if row is not None:
+                    momentum_signal = self.momentum_signal_at(row, j, symbol)
+                else:
+                    momentum_signal = self.momentum_monitor.detect_multi_timeframe_momentum(symbol)
                 if momentum_signal:
                     signals.append(momentum_signal)
                 
                 # 3. 突破回踩信号
-                pullback_signal = self.momentum_monitor.detect_pullback_opportunity(symbol)
+                if row is not None:
+                    pullback_signal = self.pullback_signal_at(row, j, symbol)
+                else:
+                    pullback_signal = self.momentum_monitor.detect_pullback_opportunity(symbol)
                 if pullback_signal:
                     signals.append(pullback_signal)
                     
@@ -546,6 +1123,10 @@ class MomentumBacktest:
         except Exception as e:
             pass
         
+        # 为信号标注币种列号，后续直接从价格矩阵读取价格（未加载的币种为-1）
+        for signal in signals:
+            signal['sym_idx'] = self.sym_to_idx.get(signal['coin'], -1)
+        
         return signals
     
     def run_backtest(self, start_date=None, end_date=None, symbols=None):
@@ -563,26 +1144,34 @@ class MomentumBacktest:
         signal_count = 0
         trade_count = 0
         
-        for i, timestamp in enumerate(self.timestamps):
-            # 每N个时间点重新评估
-            if i % self.rebalance_frequency != 0:
-                continue
-            
+        # 每N个时间点重新评估，直接按步长取出评估时间点
+        eval_timestamps = self.timestamps[::self.rebalance_frequency]
+        progress_step = max(1, len(eval_timestamps) // 10)
+        
+        for i, timestamp in enumerate(eval_timestamps):
             # 获取当前价格数据
             current_prices = self.get_price_data_at_time(timestamp)
             
             # 更新持仓
             self.portfolio.update_positions(current_prices, timestamp)
             
+            # 仓位已满时任何信号都无法开仓，跳过信号计算
+            if not self.portfolio.has_capacity_for_new_position():
+                self.portfolio.record_portfolio_value(timestamp)
+                self.print_progress(i, len(eval_timestamps), progress_step, signal_count, trade_count)
+                continue
+            
             # 计算信号
             signals = self.calculate_signals_at_time(timestamp)
             signal_count += len(signals)
             
             # 处理信号
+            row = i * self.rebalance_frequency
             for signal in signals:
                 symbol = signal['coin']
-                if symbol in current_prices:
-                    entry_price = current_prices[symbol]  # close价格
+                sym_idx = signal['sym_idx']
+                if sym_idx >= 0 and not np.isnan(self.close_mat[row, sym_idx]):
+                    entry_price = self.close_mat[row, sym_idx]  # close价格
                     signal_strength = signal['strength']
                     strategy_type = signal['type']
                     
@@ -606,11 +1195,7 @@ class MomentumBacktest:
             self.portfolio.record_portfolio_value(timestamp)
             
             # 进度显示
-            if i % (len(self.timestamps) // 10) == 0:
-                progress = (i / len(self.timestamps)) * 100
-                total_value = self.portfolio.get_total_value()
-                position_count = len(self.portfolio.positions)
-                print(f"⏳ 进度: {progress:.1f}% | 总资产: ${total_value:,.0f} | 持仓: {position_count} | 信号: {signal_count} | 交易: {trade_count}")
+            self.print_progress(i, len(eval_timestamps), progress_step, signal_count, trade_count)
         
         # 强制平仓所有剩余持仓
         final_prices = self.get_price_data_at_time(self.timestamps[-1])
@@ -621,6 +1206,14 @@ class MomentumBacktest:
         print("✅ 回测完成!")
         print(f"📊 统计: 总信号 {signal_count}, 总交易 {trade_count}")
     
+    def print_progress(self, i, total, progress_step, signal_count, trade_count):
+        """每隔progress_step个评估点打印一次进度"""
+        if i % progress_step == 0:
+            progress = (i / total) * 100
+            total_value = self.portfolio.get_total_value()
+            position_count = len(self.portfolio.positions)
+            print(f"⏳ 进度: {progress:.1f}% | 总资产: ${total_value:,.0f} | 持仓: {position_count} | 信号: {signal_count} | 交易: {trade_count}")
+    
     def generate_report(self):
         """生成回测报告"""
         print("\n" + "="*80)
@@ -637,40 +1230,38 @@ class MomentumBacktest:
         print(f"   最终资金: ${final_value:,.0f}")
         print(f"   总收益率: {total_return:.2%}")
         
-        # 交易统计
-        trades = self.portfolio.trade_history
-        buy_trades = [t for t in trades if t['action'] == 'BUY']
-        sell_trades = [t for t in trades if t['action'] == 'SELL']
+        # 交易统计（直接基于列式交易记录生成的DataFrame计算）
+        trades_df = self.portfolio.get_trades_df()
+        if len(trades_df) > 0:
+            sell_df = trades_df[trades_df['action'] == 'SELL']
+        else:
+            sell_df = trades_df
         
         print(f"\n📊 交易统计:")
-        print(f"   总交易次数: {len(trades)}")
-        print(f"   买入次数: {len(buy_trades)}")
-        print(f"   卖出次数: {len(sell_trades)}")
-        
-        if sell_trades:
-            profitable_trades = [t for t in sell_trades if t['pnl_value'] > 0]
-            win_rate = len(profitable_trades) / len(sell_trades)
-            avg_pnl = np.mean([t['pnl_pct'] for t in sell_trades])
-            avg_holding_time = np.mean([t['holding_period'] for t in sell_trades])
+        print(f"   总交易次数: {len(trades_df)}")
+        print(f"   买入次数: {len(trades_df) - len(sell_df)}")
+        print(f"   卖出次数: {len(sell_df)}")
+        
+        if len(sell_df) > 0:
+            win_rate = (sell_df['pnl_value'] > 0).mean()
+            avg_pnl = sell_df['pnl_pct'].mean()
+            avg_holding_time = sell_df['holding_period'].mean()
             
             print(f"   胜率: {win_rate:.2%}")
             print(f"   平均收益率: {avg_pnl:.2%}")
             print(f"   平均持仓时间: {avg_holding_time:.1f}小时")
             
-            # 按策略类型统计
-            strategy_stats = defaultdict(list)
-            for trade in sell_trades:
-                strategy_stats[trade['strategy']].append(trade['pnl_pct'])
+            # 按策略类型统计（按首次出现顺序输出）
+            strategy_stats = sell_df.groupby('strategy', sort=False, dropna=False)['pnl_pct'].agg(
+                avg_return='mean', win_rate=lambda pnls: (pnls > 0).mean(), count='count')
             
             print(f"\n📋 策略表现:")
-            for strategy, pnls in strategy_stats.items():
-                avg_return = np.mean(pnls)
-                win_rate = len([p for p in pnls if p > 0]) / len(pnls)
-                print(f"   {strategy}: 平均收益 {avg_return:.2%}, 胜率 {win_rate:.2%}, 交易数 {len(pnls)}")
+            for strategy, stats in strategy_stats.iterrows():
+                print(f"   {strategy}: 平均收益 {stats['avg_return']:.2%}, 胜率 {stats['win_rate']:.2%}, 交易数 {int(stats['count'])}")
         
         # 风险统计
-        if len(self.portfolio.portfolio_history) > 1:
-            portfolio_df = pd.DataFrame(self.portfolio.portfolio_history)
+        if self.portfolio.get_portfolio_history_len() > 1:
+            portfolio_df = self.portfolio.get_portfolio_history_df()
             portfolio_df['returns'] = portfolio_df['total_value'].pct_change()
             
             annual_return = total_return * (365 * 24 / ((self.timestamps[-1] - self.timestamps[0]).total_seconds() / 3600))
@@ -689,50 +1280,36 @@ class MomentumBacktest:
             'initial_value': initial_value,
             'final_value': final_value,
             'total_return': total_return,
-            'trades': trades,
-            'portfolio_history': self.portfolio.portfolio_history
+            'trades': self.portfolio.trade_history
         }
     
     def calculate_max_drawdown(self, values):
-        """计算最大回撤"""
-        peak = values.expanding().max()
-        drawdown = (values - peak) / peak
-        return drawdown.min()
+        """计算最大回撤（以正数表示）"""
+        if len(values) < 2:
+            return 0.0
+        
+        v = values.to_numpy(dtype=np.float64)
+        peak = np.maximum.accumulate(v)
+        drawdown = (peak - v) / peak
+        return float(np.nanmax(drawdown))
     
     def save_results(self, filename_prefix="momentum_backtest"):
         """保存回测结果"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # 保存交易记录
-        trades_df = pd.DataFrame(self.portfolio.trade_history)
+        trades_df = self.portfolio.get_trades_df()
         trades_file = f"../data/{filename_prefix}_trades_{timestamp}.csv"
         trades_df.to_csv(trades_file, index=False)
         
         # 保存组合历史
-        portfolio_df = pd.DataFrame(self.portfolio.portfolio_history)
+        portfolio_df = self.portfolio.get_portfolio_history_df()
         portfolio_file = f"../data/{filename_prefix}_portfolio_{timestamp}.csv"
         portfolio_df.to_csv(portfolio_file, index=False)
         
         print(f"\n💾 结果已保存:")
         print(f"   交易记录: {trades_file}")
         print(f"   组合历史: {portfolio_file}")
-    
-    def calculate_max_drawdown(self, values):
-        """计算最大回撤"""
-        if len(values) < 2:
-            return 0.0
-        
-        peak = values.iloc[0]
-        max_drawdown = 0.0
-        
-        for value in values:
-            if value > peak:
-                peak = value
-            drawdown = (peak - value) / peak
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-        
-        return max_drawdown
         
 def main():
     """主函数"""
@@ -6,31 +6,67 @@
 
 import os
 import sys
+import mmap
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import chain, islice
+from operator import itemgetter
 import argparse
+import traceback
 
 # 添加项目路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from backtest.momentum_backtest import MomentumBacktest
 
-def load_market_symbols():
-    """从exchange_binance_market.txt加载所有币种"""
+# 市场币种库文件（与数据目录一样相对于运行目录）
+MARKET_SYMBOLS_FILE = '../data/exchange_binance_market.txt'
+
+# 快速回测使用的币种数量（取币种库前N个）
+QUICK_BACKTEST_SYMBOL_LIMIT = 50
+
+@lru_cache(maxsize=4)
+def load_market_symbols(limit=None):
+    """从exchange_binance_market.txt加载币种（按limit缓存，返回元组）
+    
+    参数:
+        limit: 只取前limit个币种，读够即停止扫描文件；None表示全部
+    """
     try:
-        with open('../data/exchange_binance_market.txt', 'r', encoding='utf-8') as f:
-            symbols = [line.strip() for line in f.readlines() if line.strip()]
+        with open(MARKET_SYMBOLS_FILE, 'rb') as f:
+            # 空文件无法映射，直接视为没有币种
+            if os.fstat(f.fileno()).st_size == 0:
+                symbols = ()
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    symbols = tuple(islice(
+                        (symbol.decode('utf-8') for line in iter(mm.readline, b'') if (symbol := line.strip())),
+                        limit
+                    ))
         print(f"📋 从市场币种库加载了 {len(symbols)} 个币种")
         return symbols
     except Exception as e:
         print(f"❌ 加载币种库失败: {str(e)}")
         # 备用币种列表
-        return [
+        return (
             'BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'ADAUSDT', 'SOLUSDT',
             'DOTUSDT', 'AVAXUSDT', 'LINKUSDT', 'UNIUSDT', 'AAVEUSDT',
             'SHIBUSDT', 'DOGEUSDT', 'MATICUSDT', 'ATOMUSDT', 'FILUSDT'
-        ]
+        )[:limit]
+
+def backtest_window(days):
+    """计算截至当前时刻、回溯days天的回测区间
+    
+    返回:
+        tuple: (start_date, end_date, start_str, end_str)，日期字符串格式为%Y-%m-%d
+    
+    注意: 返回naive时间，run_backtest按naive的openTime过滤K线，不能传入带时区的时间
+    """
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return start_date, end_date, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
 
 def run_quick_backtest():
     """运行快速回测"""
@@ -43,17 +79,14 @@ def run_quick_backtest():
     )
     
     # 设置回测时间范围（使用最近的数据）
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)  # 最近30天
-    
-    print(f"📅 回测时间范围: {start_date.strftime('%Y-%m-%d')} 到 {end_date.strftime('%Y-%m-%d')}")
+    start_date, end_date, start_str, end_str = backtest_window(30)  # 最近30天
     
-    # 加载所有市场币种
-    all_symbols = load_market_symbols()
+    print(f"📅 回测时间范围: {start_str} 到 {end_str}")
     
-    # 对于快速回测，取前50个币种以控制运行时间
-    test_symbols = all_symbols[:50]
-    print(f"🎯 快速回测模式：使用前 {len(test_symbols)} 个币种")
+    # 对于快速回测，只加载币种库前QUICK_BACKTEST_SYMBOL_LIMIT个币种以控制运行时间
+    test_symbols = load_market_symbols(limit=QUICK_BACKTEST_SYMBOL_LIMIT)
+    total_symbols = len(load_market_symbols())
+    print(f"🎯 快速回测模式：使用 {total_symbols} 个币种中的前 {len(test_symbols)} 个")
     
     # 运行回测
     try:
@@ -73,7 +106,6 @@ def run_quick_backtest():
         
     except Exception as e:
         print(f"❌ 回测过程中发生错误: {str(e)}")
-        import traceback
         traceback.print_exc()
         return None
 
@@ -88,10 +120,9 @@ def run_full_backtest():
     )
     
     # 设置回测时间范围
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=90)  # 最近25天
+    start_date, end_date, start_str, end_str = backtest_window(90)  # 最近90天
     
-    print(f"📅 回测时间范围: {start_date.strftime('%Y-%m-%d')} 到 {end_date.strftime('%Y-%m-%d')}")
+    print(f"📅 回测时间范围: {start_str} 到 {end_str}")
     
     # 加载所有市场币种
     all_symbols = load_market_symbols()
@@ -115,10 +146,52 @@ def run_full_backtest():
         
     except Exception as e:
         print(f"❌ 回测过程中发生错误: {str(e)}")
-        import traceback
         traceback.print_exc()
         return None
 
+# 交易动作编码（trades_to_soa使用）
+TRADE_ACTION_CODES = {'BUY': 0, 'SELL': 1}
+
+# 一次取出交易记录中分析所需的三个字段
+_get_trade_fields = itemgetter('action', 'strategy', 'pnl_pct')
+
+def trades_to_soa(trades):
+    """将交易记录（字典的可迭代对象）一次性转换为按字段存储的NumPy数组
+    
+    返回:
+        dict: action_codes(int8, BUY=0/SELL=1/其他=-1)、strategy_ids(int16)、
+              pnl_pct(float64)，以及编号对应的策略名列表strategies
+    """
+    strategy_index = {}
+    actions = []
+    strategy_ids = []
+    pnls = []
+    for t in trades:
+        try:
+            action, strategy, pnl = _get_trade_fields(t)
+        except KeyError:
+            # 个别记录缺少strategy或pnl_pct字段时退回逐个读取
+            action, strategy, pnl = t['action'], t.get('strategy'), t.get('pnl_pct')
+        if strategy is None:
+            strategy = 'Unknown'
+        actions.append(TRADE_ACTION_CODES.get(action, -1))
+        strategy_ids.append(strategy_index.setdefault(strategy, len(strategy_index)))
+        pnls.append(0.0 if pnl is None else pnl)
+    
+    return {
+        'action_codes': np.array(actions, dtype=np.int8),
+        'strategy_ids': np.array(strategy_ids, dtype=np.int16),
+        'pnl_pct': np.array(pnls, dtype=np.float64),
+        'strategies': list(strategy_index)
+    }
+
+def aggregate_strategy_pnl(pnls, strat_ids, n_strats):
+    """按策略编号一次性统计交易次数、收益率总和与盈利次数（bincount向量化归约）"""
+    counts = np.bincount(strat_ids, minlength=n_strats)
+    sums = np.bincount(strat_ids, weights=pnls, minlength=n_strats)
+    wins = np.bincount(strat_ids, weights=(pnls > 0), minlength=n_strats)
+    return counts, sums, wins
+
 def analyze_strategy_performance(results):
     """分析策略表现"""
     if not results:
@@ -126,41 +199,49 @@ def analyze_strategy_performance(results):
     
     print(f"\n🔍 策略分析:")
     
+    # 先取第一笔卖出交易：没有卖出时立即返回，有则与剩余部分拼接，不重复扫描
     trades = results.get('trades', [])
-    sell_trades = [t for t in trades if t['action'] == 'SELL']
+    sell_iter = (t for t in trades if t['action'] == 'SELL')
+    first_sell = next(sell_iter, None)
     
-    if not sell_trades:
+    if first_sell is None:
         print("   暂无完成的交易")
         return
     
-    # 按策略分析
-    from collections import defaultdict
-    strategy_performance = defaultdict(lambda: {'trades': [], 'total_pnl': 0, 'win_count': 0})
+    # 按策略分析（卖出交易转为数组后，bincount一次完成交易数、总收益、胜率统计）
+    soa = trades_to_soa(chain([first_sell], sell_iter))
+    strategies = soa['strategies']
+    counts, sums, wins = aggregate_strategy_pnl(soa['pnl_pct'], soa['strategy_ids'], len(strategies))
     
-    for trade in sell_trades:
-        strategy = trade.get('strategy', 'Unknown')
-        pnl = trade.get('pnl_pct', 0)
-        
-        strategy_performance[strategy]['trades'].append(trade)
-        strategy_performance[strategy]['total_pnl'] += pnl
-        if pnl > 0:
-            strategy_performance[strategy]['win_count'] += 1
-    
-    # 排序并显示
-    sorted_strategies = sorted(strategy_performance.items(), 
-                              key=lambda x: x[1]['total_pnl'], reverse=True)
-    
-    print(f"\n📊 各策略详细表现:")
-    print(f"{'策略名称':<20} {'交易次数':<8} {'胜率':<8} {'总收益率':<10} {'平均收益率':<10}")
-    print("-" * 70)
-    
-    for strategy, data in sorted_strategies:
-        trade_count = len(data['trades'])
-        win_rate = data['win_count'] / trade_count if trade_count > 0 else 0
-        total_return = data['total_pnl']
-        avg_return = total_return / trade_count if trade_count > 0 else 0
-        
-        print(f"{strategy:<20} {trade_count:<8} {win_rate:<8.2%} {total_return:<10.2%} {avg_return:<10.2%}")
+    # 排序并显示（按总收益率降序，同值保持首次出现的顺序）
+    order = np.argsort(-sums, kind='stable')
+    
+    # 表头与各策略行先拼好，一次输出
+    rows = [
+        f"\n📊 各策略详细表现:",
+        f"{'策略名称':<20} {'交易次数':<8} {'胜率':<8} {'总收益率':<10} {'平均收益率':<10}",
+        "-" * 70
+    ]
+    for k in order:
+        trade_count = int(counts[k])
+        win_rate = wins[k] / trade_count
+        avg_return = sums[k] / trade_count
+        rows.append(f"{strategies[k]:<20} {trade_count:<8} {win_rate:<8.2%} {sums[k]:<10.2%} {avg_return:<10.2%}")
+    print('\n'.join(rows))
+
+# 启动横幅（含系统特性说明），main中一次性输出
+_BANNER = "\n".join([
+    "=" * 80,
+    "🚀           动量策略回测系统           🚀",
+    "=" * 80,
+    "📋 系统特性:",
+    "   • 基于advanced_momentum_strategy的多策略信号",
+    "   • 完整的仓位管理和风险控制",
+    "   • 自动止损止盈",
+    "   • 详细的性能分析报告",
+    "   • 使用exchange_binance_market.txt中的全部币种",
+    "=" * 80,
+]) + "\n"
 
 def main():
     parser = argparse.ArgumentParser(description='动量策略回测系统')
@@ -169,19 +250,10 @@ def main():
     
     args = parser.parse_args()
     
-    print("="*80)
-    print("🚀           动量策略回测系统           🚀")
-    print("="*80)
-    print("📋 系统特性:")
-    print("   • 基于advanced_momentum_strategy的多策略信号")
-    print("   • 完整的仓位管理和风险控制")
-    print("   • 自动止损止盈")
-    print("   • 详细的性能分析报告")
-    print("   • 使用exchange_binance_market.txt中的全部币种")
-    print("="*80)
+    sys.stdout.write(_BANNER)
     
     if args.mode == 'quick':
-        print(f"🔧 运行模式: 快速测试（前50个币种）")
+        print(f"🔧 运行模式: 快速测试（前{QUICK_BACKTEST_SYMBOL_LIMIT}个币种）")
         results = run_quick_backtest()
     else:
         print(f"🔧 运行模式: 完整回测（全部337个币种）")
@@ -6,11 +6,14 @@
 
 import os
 import sys
+import io
+import contextlib
 import pandas as pd
 import numpy as np
 import glob
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import warnings
 import json
 import argparse
@@ -28,13 +31,21 @@ plt.rcParams['axes.unicode_minus'] = False
 BEIJING_TZ = pytz.timezone('Asia/Shanghai')
 
 def to_beijing_time(utc_time):
-    """将UTC时间转换为北京时间"""
+    """将UTC时间转换为北京时间（已是北京时间则直接返回）"""
+    if getattr(utc_time.tzinfo, 'zone', None) == BEIJING_TZ.zone:
+        return utc_time
     if utc_time.tzinfo is None:
         utc_time = pytz.utc.localize(utc_time)
     elif utc_time.tzinfo != pytz.utc:
         utc_time = utc_time.astimezone(pytz.utc)
     return utc_time.astimezone(BEIJING_TZ)
 
+def to_beijing_time_series(utc_times):
+    """批量将UTC时间列转换为北京时间（向量化时区转换，已带时区的列直接转换）"""
+    if utc_times.dt.tz is None:
+        utc_times = utc_times.dt.tz_localize('UTC')
+    return utc_times.dt.tz_convert(BEIJING_TZ)
+
 # 添加项目路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -43,22 +54,103 @@ from monitor.volume_breakout_strategy import VolumeBreakoutMonitor
 from utils.log_utils import print_log
 from backtest.momentum_backtest import Position, Portfolio, MomentumBacktest
 
+def aggregate_volume_bars(df, periods):
+    """按列一次性完成成交量突破所需的周期聚合（与VolumeBreakoutMonitor.aggregate_to_timeframe结果一致）
+    
+    按openTime排序后以行索引标签 // periods分组，只保留完整的组；
+    组内取第一根的openTime/open、最后一根的close，成交额求和。
+    返回dict：openTime(int64纳秒)、open、close（float32）、quote_volumn（float64），无完整分组时为None
+    """
+    open_time = df['openTime'].to_numpy(dtype='datetime64[ns]').view('i8')
+    open_prices = df['open'].to_numpy(dtype=np.float32)
+    close_prices = df['close'].to_numpy(dtype=np.float32)
+    quote_volumes = df['quote_volumn'].to_numpy(dtype=np.float64)
+    
+    if periods > 1:
+        # 先按时间排序，再按分组号稳定排序，组内保持时间顺序
+        order = np.argsort(open_time, kind='stable')
+        groups = df.index.to_numpy()[order] // periods
+        group_order = np.argsort(groups, kind='stable')
+        order = order[group_order]
+        groups = groups[group_order]
+        
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        counts = np.diff(np.r_[starts, len(groups)])
+        complete = counts == periods
+        ends = starts + counts - 1
+        
+        open_time = open_time[order][starts[complete]]
+        open_prices = open_prices[order][starts[complete]]
+        close_prices = close_prices[order][ends[complete]]
+        quote_volumes = np.add.reduceat(quote_volumes[order], starts)[complete]
+    
+    if len(open_time) == 0:
+        return None
+    # 成交额保持float64，成交额基准和倍数算完后再降精度存储
+    return {'openTime': open_time, 'open': open_prices, 'close': close_prices,
+            'quote_volumn': quote_volumes}
+
+def volume_breakout_features(open_prices, close_prices, quote_volumes):
+    """一次性计算每根聚合K线的成交量突破检测数值（与逐根检测的计算一致）
+    
+    成交额累计和、基准和倍数都用float64计算（与VolumeBreakoutMonitor一致），
+    倍数要与阈值比较，保持float64；成交额和基准只用于展示和大于0的判断，存为float32。
+    返回dict：
+    - close / quote_volumn: 收盘价与成交额
+    - price_change_pct: 该K线涨幅
+    - baseline_quote_volume: 该K线之前全部K线的成交额均值（首根K线为NaN）
+    - quote_volume_ratio: 成交额相对基准的倍数
+    """
+    n = len(quote_volumes)
+    quote_volumes = np.asarray(quote_volumes, dtype=np.float64)
+    cum_quote_volume = np.cumsum(quote_volumes)
+    baseline = np.full(n, np.nan, dtype=np.float64)
+    baseline[1:] = cum_quote_volume[:-1] / np.arange(1, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_change_pct = (close_prices - open_prices) / open_prices
+        ratio = quote_volumes / baseline
+    return {
+        'close': close_prices,
+        'quote_volumn': quote_volumes.astype(np.float32),
+        'price_change_pct': price_change_pct,
+        'baseline_quote_volume': baseline.astype(np.float32),
+        'quote_volume_ratio': ratio
+    }
+
+def nearest_time_index(sorted_times, query_times):
+    """为每个查询时间找到已排序时间序列中最接近的位置（距离相同时取较早的点）"""
+    last = len(sorted_times) - 1
+    pos = np.searchsorted(sorted_times, query_times)
+    left = np.clip(pos - 1, 0, last)
+    right = np.clip(pos, 0, last)
+    choose_left = np.abs(query_times - sorted_times[left]) <= np.abs(sorted_times[right] - query_times)
+    return np.where(choose_left, left, right)
+
 class SingleStrategyBacktest(MomentumBacktest):
     """单策略回测引擎"""
     
-    def __init__(self, strategy_name, data_dir="crypto/data/spot_min_binance", initial_capital=100000, timeframe="1h", buy_strategy="close"):
+    def __init__(self, strategy_name, data_dir="crypto/data/spot_min_binance", initial_capital=100000, timeframe="1h", buy_strategy="close", interactive=False):
         super().__init__(data_dir, initial_capital)
         self.strategy_name = strategy_name
         self.timeframe = timeframe
         self.buy_strategy = buy_strategy
+        self.interactive = interactive  # 为True时绘图后弹出窗口显示，否则只保存图片
         
         # 使用指定的买入策略创建Portfolio
         self.portfolio = Portfolio(initial_capital, buy_strategy)
         
         self.volume_monitor = VolumeBreakoutMonitor(volume_multiplier=5.0, timeframe=timeframe)  # 使用新的放量突破条件
         
-        # 性能优化：预聚合数据缓存
-        self.pre_aggregated_data = {}
+        # 性能优化：预聚合数据按列提取为NumPy数组（symbol -> 各列数组，无聚合数据时为None）
+        self.pre_aggregated_arrays = {}
+        
+        # 组合历史DataFrame缓存（get_portfolio_df）
+        self._portfolio_df = None
+        
+        # 成交量突破截面矩阵（行：时间点，列：币种），预处理后一次性构建
+        self.agg_bar_count_mat = None  # 各时间点（含）之前的聚合K线数量
+        self.agg_candidate_mat = None  # 涨幅和基准条件已满足（只差成交额倍数）
+        self.agg_ratio_mat = None  # 当前聚合K线的成交额倍数
         
         # 支持的策略列表
         self.available_strategies = {
@@ -75,12 +167,48 @@ class SingleStrategyBacktest(MomentumBacktest):
         """预处理数据以提高回测性能"""
         if self.strategy_name == 'volume_breakout':
             print("🔧 预处理成交量突破策略数据...")
+            periods = self.volume_monitor.periods_per_timeframe
             for symbol in self.all_data.keys():
-                # 预先聚合所有数据
+                # 预先聚合所有数据（按列数组分组归约，不逐组构造DataFrame）
                 if symbol != 'BTCUSDT':
-                    aggregated_df = self.volume_monitor.get_aggregated_data(symbol, self.all_data[symbol])
-                    self.pre_aggregated_data[symbol] = aggregated_df
-            print(f"✅ 预处理完成，{len(self.pre_aggregated_data)}个币种")
+                    df = self.all_data[symbol]
+                    aggregated = aggregate_volume_bars(df, periods) if len(df) > 0 else None
+                    if aggregated is None:
+                        self.pre_aggregated_arrays[symbol] = None
+                        continue
+                    
+                    # openTime为int64纳秒，检测时按时间二分查找当前K线位置；
+                    # 每根K线的涨幅、成交额基准和倍数一次性向量化算好，检测时只需按位置读取
+                    # 价格和成交额用float32存储以减半内存，与阈值比较的成交额倍数保持float64
+                    arrays = volume_breakout_features(
+                        aggregated['open'], aggregated['close'], aggregated['quote_volumn']
+                    )
+                    arrays['openTime'] = aggregated['openTime']
+                    self.pre_aggregated_arrays[symbol] = arrays
+            self.build_volume_breakout_matrix()
+            print(f"✅ 预处理完成，{len(self.pre_aggregated_arrays)}个币种")
+    
+    def build_volume_breakout_matrix(self):
+        """把各币种当前聚合K线的检测数值对齐到统一时间索引，每个时间点一次比较全部币种"""
+        time_i8 = pd.DatetimeIndex(self.timestamps).to_numpy(dtype='datetime64[ns]').view('i8')
+        shape = (len(self.timestamps), len(self.symbols))
+        self.agg_bar_count_mat = np.zeros(shape, dtype=np.int64)
+        self.agg_candidate_mat = np.zeros(shape, dtype=bool)
+        self.agg_ratio_mat = np.full(shape, np.nan, dtype=np.float64)
+        
+        for j, symbol in enumerate(self.symbols):
+            arrays = self.pre_aggregated_arrays.get(symbol)
+            if arrays is None:
+                continue
+            
+            k = np.searchsorted(arrays['openTime'], time_i8, side='right')
+            self.agg_bar_count_mat[:, j] = k
+            has_history = k >= 2
+            m = k[has_history] - 1
+            price_change_pct = arrays['price_change_pct'][m]
+            self.agg_candidate_mat[has_history, j] = ((price_change_pct > 0) & (price_change_pct < 0.2) &
+                                                      (arrays['baseline_quote_volume'][m] > 0))
+            self.agg_ratio_mat[has_history, j] = arrays['quote_volume_ratio'][m]
     
     def calculate_signals_at_time(self, timestamp):
         """计算指定时间点的特定策略信号"""
@@ -102,157 +230,151 @@ class SingleStrategyBacktest(MomentumBacktest):
             # 板块轮动策略
             signals = self._detect_sector_rotation_signals(timestamp)
         
+        # 为信号标注币种列号，后续直接从价格矩阵读取价格（未加载的币种为-1）
+        for signal in signals:
+            signal['sym_idx'] = self.sym_to_idx.get(signal['coin'], -1)
+        
         return signals
     
     def _detect_volume_breakout_signals(self, timestamp):
         """检测成交量突破信号（性能优化版）"""
         signals = []
         
+        row = self.ts_to_idx.get(timestamp)
+        if row is not None and self.agg_candidate_mat is not None:
+            # 一次比较全部币种，只对满足条件的币种生成信号
+            hits = self.agg_candidate_mat[row] & (self.agg_ratio_mat[row] >= self.volume_monitor.volume_multiplier)
+            for j in np.flatnonzero(hits):
+                symbol = self.symbols[j]
+                result = self._detect_volume_signal_fast(symbol, self.pre_aggregated_arrays[symbol],
+                                                         self.agg_bar_count_mat[row, j])
+                if result['detected']:
+                    signals.append(self._volume_breakout_signal(symbol, result))
+            return signals
+        
+        # 不在统一时间索引上时逐币种检测
+        timestamp_i8 = pd.Timestamp(timestamp).value
         for symbol in self.all_data.keys():
             if symbol == 'BTCUSDT':
                 continue
             
-            try:
-                # 使用预聚合的数据或者原始数据
-                if symbol in self.pre_aggregated_data:
-                    # 使用预聚合数据，只需要检查当前时间点
-                    aggregated_df = self.pre_aggregated_data[symbol]
-                    if aggregated_df is None or len(aggregated_df) == 0:
-                        continue
-                    
-                    # 找到当前时间点对应的聚合数据
-                    mask = aggregated_df['openTime'] <= timestamp
-                    if not mask.any():
-                        continue
-                    
-                    current_data = aggregated_df[mask]
-                    if len(current_data) < 2:
-                        continue
-                    
-                    # 直接使用聚合数据检测信号
-                    result = self._detect_volume_signal_fast(symbol, current_data, timestamp)
-                else:
-                    # 回退到原始方法
-                    hist_data = self.get_historical_data_for_signal(timestamp, symbol)
-                    if hist_data is None or len(hist_data) < self.lookback_window:
-                        continue
-                    result = self.volume_monitor.detect_volume_breakout(symbol, hist_data)
+            # 使用预聚合的数据或者原始数据
+            if symbol in self.pre_aggregated_arrays:
+                # 使用预聚合数据，只需要检查当前时间点
+                arrays = self.pre_aggregated_arrays[symbol]
+                if arrays is None:
+                    continue
                 
-                if result.get('detected', False):
-                    signal = {
-                        'type': '成交量突破',
-                        'coin': symbol,
-                        'strength': result.get('quote_volume_ratio', 0),
-                        'price': result.get('current_price', 0),
-                        'details': result.get('reason', '成交量突破')
-                    }
-                    signals.append(signal)
-                    
-            except Exception as e:
-                continue
+                # 二分查找当前时间点（含）之前的聚合K线数量
+                k = np.searchsorted(arrays['openTime'], timestamp_i8, side='right')
+                if k < 2:
+                    continue
+                
+                # 直接使用聚合数据检测信号
+                result = self._detect_volume_signal_fast(symbol, arrays, k)
+            else:
+                # 回退到原始方法
+                hist_data = self.get_historical_data_for_signal(timestamp, symbol)
+                if hist_data is None or len(hist_data) < self.lookback_window:
+                    continue
+                result = self.volume_monitor.detect_volume_breakout(symbol, hist_data)
+            
+            if result['detected']:
+                signals.append(self._volume_breakout_signal(symbol, result))
                 
         return signals
     
-    def _detect_volume_signal_fast(self, symbol, aggregated_df, timestamp):
-        """快速检测成交量信号（使用预聚合数据）"""
-        try:
-            if len(aggregated_df) < 2:
-                return {'detected': False, 'reason': '数据不足'}
-            
-            # 获取最新的K线数据
-            current_bar = aggregated_df.iloc[-1]
-            current_quote_volume = current_bar['quote_volumn']
-            current_price = current_bar['close']
-            open_price = current_bar['open']
-            
-            # 检查价格上升
-            price_change_pct = (current_price - open_price) / open_price
-            if price_change_pct <= 0:
-                return {'detected': False, 'reason': f'{self.volume_monitor.timeframe_name}价格下降或持平'}
-            
-            if price_change_pct >= 0.2:  # 涨幅过大
-                return {'detected': False, 'reason': f'{self.volume_monitor.timeframe_name}涨幅超过20%'}
-            
-            # 计算成交额基准
-            quote_volumes = aggregated_df['quote_volumn'].values
-            if len(quote_volumes) < 2:
-                return {'detected': False, 'reason': '基准数据不足'}
-            
-            baseline_quote_volume = np.mean(quote_volumes[:-1])  # 简化的基准计算
-            if baseline_quote_volume <= 0:
-                return {'detected': False, 'reason': '基准成交额为0'}
-            
-            quote_volume_ratio = current_quote_volume / baseline_quote_volume
-            
-            # 检查是否达到突破阈值
-            volume_condition = quote_volume_ratio >= self.volume_monitor.volume_multiplier
-            price_condition = (price_change_pct > 0) and (price_change_pct < 0.2)
-            
-            # 简化盘整检测（为了性能）
-            consolidation_condition = True  # 暂时跳过盘整检测以提高性能
-            
-            detected = volume_condition and price_condition and consolidation_condition
-            
-            return {
-                'detected': detected,
-                'current_quote_volume': current_quote_volume,
-                'baseline_quote_volume': baseline_quote_volume,
-                'quote_volume_ratio': quote_volume_ratio,
-                'current_price': current_price,
-                'price_change_pct': price_change_pct,
-                'reason': f"{self.volume_monitor.timeframe_name}成交额{quote_volume_ratio:.1f}倍, 涨幅{price_change_pct*100:.1f}%" if detected else "条件不满足"
-            }
-            
-        except Exception as e:
-            return {'detected': False, 'reason': f'检测错误: {str(e)}'}
+    def _volume_breakout_signal(self, symbol, result):
+        """由检测结果生成成交量突破信号"""
+        return {
+            'type': '成交量突破',
+            'coin': symbol,
+            'strength': result.get('quote_volume_ratio', 0),
+            'price': result.get('current_price', 0),
+            'details': result.get('reason', '成交量突破')
+        }
+    
+    def _detect_volume_signal_fast(self, symbol, arrays, k):
+        """快速检测成交量信号（使用预聚合数据的前k根K线）"""
+        if k < 2:
+            return {'detected': False, 'reason': '数据不足'}
+        
+        # 获取最新的K线数据
+        m = k - 1
+        current_quote_volume = arrays['quote_volumn'][m]
+        current_price = arrays['close'][m]
+        
+        # 检查价格上升
+        price_change_pct = arrays['price_change_pct'][m]
+        if price_change_pct <= 0:
+            return {'detected': False, 'reason': f'{self.volume_monitor.timeframe_name}价格下降或持平'}
+        
+        if price_change_pct >= 0.2:  # 涨幅过大
+            return {'detected': False, 'reason': f'{self.volume_monitor.timeframe_name}涨幅超过20%'}
+        
+        # 计算成交额基准
+        baseline_quote_volume = arrays['baseline_quote_volume'][m]  # 简化的基准计算：之前全部K线的均值
+        if baseline_quote_volume <= 0:
+            return {'detected': False, 'reason': '基准成交额为0'}
+        
+        quote_volume_ratio = arrays['quote_volume_ratio'][m]
+        
+        # 检查是否达到突破阈值
+        volume_condition = quote_volume_ratio >= self.volume_monitor.volume_multiplier
+        price_condition = (price_change_pct > 0) and (price_change_pct < 0.2)
+        
+        # 简化盘整检测（为了性能）
+        consolidation_condition = True  # 暂时跳过盘整检测以提高性能
+        
+        detected = volume_condition and price_condition and consolidation_condition
+        
+        return {
+            'detected': detected,
+            'current_quote_volume': current_quote_volume,
+            'baseline_quote_volume': baseline_quote_volume,
+            'quote_volume_ratio': quote_volume_ratio,
+            'current_price': current_price,
+            'price_change_pct': price_change_pct,
+            'reason': f"{self.volume_monitor.timeframe_name}成交额{quote_volume_ratio:.1f}倍, 涨幅{price_change_pct*100:.1f}%" if detected else "条件不满足"
+        }
     
     def _detect_multi_timeframe_signals(self, timestamp):
         """检测多时间框架共振信号"""
-        signals = []
-        
-        for symbol in self.all_data.keys():
-            if symbol == 'BTCUSDT':
-                continue
-                
-            hist_data = self.get_historical_data_for_signal(timestamp, symbol)
-            if hist_data is None or len(hist_data) < self.lookback_window:
-                continue
-            
-            try:
-                # 临时设置数据用于信号计算
-                self.momentum_monitor.price_data = {symbol: hist_data, 'BTCUSDT': self.all_data.get('BTCUSDT')}
-                
-                momentum_signal = self.momentum_monitor.detect_multi_timeframe_momentum(symbol)
-                if momentum_signal:
-                    signals.append(momentum_signal)
-                    
-            except Exception as e:
-                continue
-                
-        return signals
+        return self._detect_feature_signals(timestamp, self.momentum_signal_at,
+                                            self.momentum_monitor.detect_multi_timeframe_momentum)
     
     def _detect_pullback_signals(self, timestamp):
         """检测突破回踩信号"""
+        return self._detect_feature_signals(timestamp, self.pullback_signal_at,
+                                            self.momentum_monitor.detect_pullback_opportunity)
+    
+    def _detect_feature_signals(self, timestamp, signal_at, detect):
+        """逐币种检测信号
+        
+        时间点在统一时间索引上时直接从加载时算好的特征矩阵读取（signal_at），无需切片历史数据；
+        否则切片历史窗口交给监控器检测（detect）。
+        """
         signals = []
+        row = self.ts_to_idx.get(timestamp)
+        btc_data = self.all_data.get('BTCUSDT')
         
-        for symbol in self.all_data.keys():
+        for j, symbol in enumerate(self.symbols):
             if symbol == 'BTCUSDT':
                 continue
-                
-            hist_data = self.get_historical_data_for_signal(timestamp, symbol)
-            if hist_data is None or len(hist_data) < self.lookback_window:
-                continue
             
-            try:
-                # 临时设置数据用于信号计算
-                self.momentum_monitor.price_data = {symbol: hist_data, 'BTCUSDT': self.all_data.get('BTCUSDT')}
+            if row is not None:
+                signal = signal_at(row, j, symbol)
+            else:
+                hist_data = self.get_historical_data_for_signal(timestamp, symbol)
+                if hist_data is None or len(hist_data) < self.lookback_window:
+                    continue
                 
-                pullback_signal = self.momentum_monitor.detect_pullback_opportunity(symbol)
-                if pullback_signal:
-                    signals.append(pullback_signal)
-                    
-            except Exception as e:
-                continue
+                # 临时设置数据用于信号计算
+                self.momentum_monitor.price_data = {symbol: hist_data, 'BTCUSDT': btc_data}
+                signal = detect(symbol)
+            
+            if signal:
+                signals.append(signal)
                 
         return signals
     
@@ -296,10 +418,14 @@ class SingleStrategyBacktest(MomentumBacktest):
         signal_count = 0
         trade_count = 0
         
-        for i, timestamp in enumerate(self.timestamps):
-            # 每N个时间点重新评估
-            if i % self.rebalance_frequency != 0:
-                continue
+        # 每N个时间点重新评估，直接按步长取出评估时间点
+        eval_timestamps = self.timestamps[::self.rebalance_frequency]
+        # 进度打印间隔在循环外算好（评估点不足10个时按1处理，避免除零）
+        progress_step = max(1, len(eval_timestamps) // 10)
+        
+        for step, timestamp in enumerate(eval_timestamps):
+            # 评估点在完整时间轴上的行号
+            i = step * self.rebalance_frequency
             
             # 获取当前价格数据
             current_prices = self.get_price_data_at_time(timestamp)
@@ -311,19 +437,20 @@ class SingleStrategyBacktest(MomentumBacktest):
             signals = self.calculate_signals_at_time(timestamp)
             signal_count += len(signals)
             
+            # 北京时间只在本时间点首次开仓成功时转换一次，同一时间点的后续开仓复用
+            beijing_time = None
+            
             # 处理信号
             for signal in signals:
                 symbol = signal['coin']
-                if symbol in current_prices:
-                    entry_price = current_prices[symbol]
+                sym_idx = signal['sym_idx']
+                if sym_idx >= 0 and not np.isnan(self.close_mat[i, sym_idx]):
+                    entry_price = self.close_mat[i, sym_idx]
                     signal_strength = signal['strength']
                     strategy_type = signal['type']
                     
-                    # 获取open价格用于黄金分割点计算
-                    open_price = self.get_open_price_at_time(symbol, timestamp)
-                    
-                    # 获取下一根K线的低点，用于判断黄金分割点是否能成交
-                    next_low_price = self.get_next_low_price_at_time(symbol, timestamp)
+                    # 获取open价格用于黄金分割点计算，以及下一根K线的低点，用于判断黄金分割点是否能成交
+                    open_price, next_low_price = self._open_and_next_low_price(symbol, i, sym_idx)
                     
                     # 尝试开仓
                     success, message = self.portfolio.open_position(
@@ -332,18 +459,15 @@ class SingleStrategyBacktest(MomentumBacktest):
                     
                     if success:
                         trade_count += 1
-                        beijing_time = to_beijing_time(timestamp)
+                        if beijing_time is None:
+                            beijing_time = to_beijing_time(timestamp)
                         print(f"[{beijing_time.strftime('%m-%d %H:%M')}] 开仓 {symbol} @ {entry_price:.6f} ({strategy_type})")
             
             # 记录组合价值
             self.portfolio.record_portfolio_value(timestamp)
             
             # 进度显示
-            if i % (len(self.timestamps) // 10) == 0:
-                progress = (i / len(self.timestamps)) * 100
-                total_value = self.portfolio.get_total_value()
-                position_count = len(self.portfolio.positions)
-                print(f"⏳ 进度: {progress:.1f}% | 总资产: ${total_value:,.0f} | 持仓: {position_count} | 信号: {signal_count} | 交易: {trade_count}")
+            self.print_progress(step, len(eval_timestamps), progress_step, signal_count, trade_count)
         
         # 强制平仓所有剩余持仓
         final_prices = self.get_price_data_at_time(self.timestamps[-1])
@@ -354,6 +478,24 @@ class SingleStrategyBacktest(MomentumBacktest):
         print("✅ 回测完成!")
         print(f"📊 【{strategy_display_name}】统计: 总信号 {signal_count}, 总交易 {trade_count}")
     
+    def _open_and_next_low_price(self, symbol, row, j):
+        """获取当前K线的开盘价和下一根K线的最低价（row/j为统一时间索引的行号和币种列号）
+        
+        直接读取K线位置矩阵，不再逐次二分查找。
+        """
+        k = self.bar_idx_mat[row, j]
+        arrays = self.arr_data[symbol]
+        open_price = arrays['open'][k] if k >= 0 else None
+        next_low_price = arrays['low'][k + 1] if k + 1 < len(arrays['low']) else None
+        return open_price, next_low_price
+    
+    def get_portfolio_df(self):
+        """组合历史DataFrame（报告、绘图和保存共用，组合历史有新记录时才重新构建）"""
+        history_len = self.portfolio.get_portfolio_history_len()
+        if self._portfolio_df is None or len(self._portfolio_df) != history_len:
+            self._portfolio_df = self.portfolio.get_portfolio_history_df()
+        return self._portfolio_df
+    
     def generate_strategy_report(self):
         """生成单策略回测报告"""
         strategy_display_name = self.available_strategies[self.strategy_name]
@@ -400,11 +542,8 @@ class SingleStrategyBacktest(MomentumBacktest):
             print(f"💔 最差交易: {worst_trade['symbol']} ({worst_trade['pnl_pct']:.2%})")
         
         # 风险统计
-        if len(self.portfolio.portfolio_history) > 1:
-            portfolio_df = pd.DataFrame(self.portfolio.portfolio_history)
-            portfolio_df['returns'] = portfolio_df['total_value'].pct_change()
-            
-            max_drawdown = self.calculate_max_drawdown(portfolio_df['total_value'])
+        if self.portfolio.get_portfolio_history_len() > 1:
+            max_drawdown = self.calculate_max_drawdown(self.get_portfolio_df()['total_value'])
             
             print(f"\n⚠️  风险指标:")
             print(f"   最大回撤: {max_drawdown:.2%}")
@@ -418,111 +557,104 @@ class SingleStrategyBacktest(MomentumBacktest):
             'initial_value': initial_value,
             'final_value': final_value,
             'total_return': total_return,
-            'trades': trades,
-            'portfolio_history': self.portfolio.portfolio_history
+            'trades': trades
         }
     
     def plot_equity_curve(self):
         """绘制收益曲线图"""
-        if not self.portfolio.portfolio_history:
+        if self.portfolio.get_portfolio_history_len() == 0:
             print("⚠️  没有组合历史数据，跳过绘图")
             return
         
         try:
             # 准备数据
-            portfolio_df = pd.DataFrame(self.portfolio.portfolio_history)
-            portfolio_df['timestamp'] = pd.to_datetime(portfolio_df['timestamp'])
-            portfolio_df['beijing_time'] = portfolio_df['timestamp'].apply(lambda x: to_beijing_time(x))
-            
-            # 计算收益率
+            # 在缓存的组合历史副本上添加绘图用的列，不影响保存的组合历史
+            portfolio_df = self.get_portfolio_df()
             initial_value = self.portfolio.initial_capital
-            portfolio_df['total_return'] = (portfolio_df['total_value'] - initial_value) / initial_value * 100
+            portfolio_df = portfolio_df.assign(
+                beijing_time=to_beijing_time_series(portfolio_df['timestamp']),
+                total_return=(portfolio_df['total_value'] - initial_value) / initial_value * 100  # 计算收益率
+            )
             
-            # 创建图表
-            plt.figure(figsize=(12, 8))
+            # 创建图表：两个子图共享x轴
+            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
             
             # 子图1: 资产价值曲线
-            plt.subplot(2, 1, 1)
-            plt.plot(portfolio_df['beijing_time'], portfolio_df['total_value'], 
+            ax1.plot(portfolio_df['beijing_time'], portfolio_df['total_value'], 
                     color='blue', linewidth=2, label='总资产价值')
-            plt.axhline(y=initial_value, color='red', linestyle='--', alpha=0.7, label='初始资金')
-            plt.title(f'【{self.available_strategies[self.strategy_name]}】资产价值变化', fontsize=14, fontweight='bold')
-            plt.ylabel('资产价值 (USDT)', fontsize=12)
-            plt.legend()
-            plt.grid(True, alpha=0.3)
-            
-            # 格式化x轴
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-            plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=2))
-            plt.xticks(rotation=45)
+            ax1.axhline(y=initial_value, color='red', linestyle='--', alpha=0.7, label='初始资金')
+            ax1.set_title(f'【{self.available_strategies[self.strategy_name]}】资产价值变化', fontsize=14, fontweight='bold')
+            ax1.set_ylabel('资产价值 (USDT)', fontsize=12)
+            ax1.legend()
+            ax1.grid(True, alpha=0.3)
             
             # 子图2: 收益率曲线
-            plt.subplot(2, 1, 2)
-            plt.plot(portfolio_df['beijing_time'], portfolio_df['total_return'], 
+            ax2.plot(portfolio_df['beijing_time'], portfolio_df['total_return'], 
                     color='green', linewidth=2, label='累计收益率')
-            plt.axhline(y=0, color='red', linestyle='--', alpha=0.7, label='盈亏平衡线')
-            plt.title('累计收益率变化', fontsize=14, fontweight='bold')
-            plt.xlabel('时间 (北京时间)', fontsize=12)
-            plt.ylabel('收益率 (%)', fontsize=12)
-            plt.legend()
-            plt.grid(True, alpha=0.3)
-            
-            # 格式化x轴
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-            plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=2))
-            plt.xticks(rotation=45)
+            ax2.axhline(y=0, color='red', linestyle='--', alpha=0.7, label='盈亏平衡线')
+            ax2.set_title('累计收益率变化', fontsize=14, fontweight='bold')
+            ax2.set_xlabel('时间 (北京时间)', fontsize=12)
+            ax2.set_ylabel('收益率 (%)', fontsize=12)
+            ax2.legend()
+            ax2.grid(True, alpha=0.3)
+            
+            # 格式化x轴（共享x轴，设置一次即可）
+            ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+            ax2.xaxis.set_major_locator(mdates.DayLocator(interval=2))
+            ax2.tick_params(axis='x', labelrotation=45)
             
             # 添加交易标记
-            self.add_trade_markers(portfolio_df)
+            self.add_trade_markers(ax2, portfolio_df)
             
             # 调整布局
-            plt.tight_layout()
+            fig.tight_layout()
             
             # 保存图片
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             chart_file = f"../data/{self.strategy_name}_equity_curve_{timestamp}.png"
-            plt.savefig(chart_file, dpi=300, bbox_inches='tight')
+            fig.savefig(chart_file, dpi=300, bbox_inches='tight')
             print(f"\n📊 收益曲线图已保存: {chart_file}")
             
-            # 显示图片
-            plt.show()
+            # 显示图片（仅交互运行时弹窗，批量运行只保存图片并释放图形）
+            if self.interactive:
+                plt.show()
+            else:
+                plt.close(fig)
             
         except Exception as e:
             print(f"⚠️  绘图失败: {str(e)}")
     
-    def add_trade_markers(self, portfolio_df):
-        """在收益曲线上添加交易标记"""
+    def add_trade_markers(self, ax, portfolio_df):
+        """在收益率子图ax上添加交易标记"""
         try:
-            if not self.portfolio.trade_history:
+            # 获取买入和卖出交易（直接由按列存储的交易缓冲区构建DataFrame）
+            trades_df = self.portfolio.get_trades_df()
+            if trades_df.empty:
                 return
             
-            # 获取买入和卖出交易
-            trades_df = pd.DataFrame(self.portfolio.trade_history)
-            trades_df['timestamp'] = pd.to_datetime(trades_df['timestamp'])
-            trades_df['beijing_time'] = trades_df['timestamp'].apply(lambda x: to_beijing_time(x))
+            trades_df['beijing_time'] = to_beijing_time_series(trades_df['timestamp'])
             
             buy_trades = trades_df[trades_df['action'] == 'BUY']
             sell_trades = trades_df[trades_df['action'] == 'SELL']
             
-            # 为每个交易找到对应的组合价值
-            for _, trade in buy_trades.iterrows():
-                # 找到最接近的组合价值时间点
-                closest_idx = (portfolio_df['timestamp'] - trade['timestamp']).abs().idxmin()
-                if closest_idx in portfolio_df.index:
-                    plt.scatter(trade['beijing_time'], 
-                              portfolio_df.loc[closest_idx, 'total_return'],
-                              color='green', marker='^', s=60, alpha=0.8, 
-                              label='买入' if _ == buy_trades.index[0] else "")
-            
-            # 标记卖出交易
-            for _, trade in sell_trades.iterrows():
-                closest_idx = (portfolio_df['timestamp'] - trade['timestamp']).abs().idxmin()
-                if closest_idx in portfolio_df.index:
-                    color = 'red' if trade['pnl_pct'] < 0 else 'orange'
-                    plt.scatter(trade['beijing_time'], 
-                              portfolio_df.loc[closest_idx, 'total_return'],
-                              color=color, marker='v', s=60, alpha=0.8,
-                              label='卖出' if _ == sell_trades.index[0] else "")
+            # 为每个交易找到最接近的组合价值时间点（组合历史按时间排序，一次二分查找）
+            portfolio_times = portfolio_df['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+            total_returns = portfolio_df['total_return'].to_numpy()
+            buy_returns = total_returns[nearest_time_index(
+                portfolio_times, buy_trades['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8'))]
+            sell_returns = total_returns[nearest_time_index(
+                portfolio_times, sell_trades['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8'))]
+            
+            # 每类标记只调用一次scatter
+            if len(buy_trades) > 0:
+                ax.scatter(buy_trades['beijing_time'], buy_returns,
+                           color='green', marker='^', s=60, alpha=0.8, label='买入')
+            
+            # 标记卖出交易（亏损红色，其余橙色）
+            if len(sell_trades) > 0:
+                sell_colors = np.where(sell_trades['pnl_pct'].to_numpy() < 0, 'red', 'orange')
+                ax.scatter(sell_trades['beijing_time'], sell_returns,
+                           c=sell_colors, marker='v', s=60, alpha=0.8, label='卖出')
             
         except Exception as e:
             print(f"⚠️  添加交易标记失败: {str(e)}")
@@ -532,13 +664,13 @@ class SingleStrategyBacktest(MomentumBacktest):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         strategy_name = self.strategy_name
         
-        # 保存交易记录
-        trades_df = pd.DataFrame(self.portfolio.trade_history)
+        # 保存交易记录（直接由按列存储的交易缓冲区构建DataFrame）
+        trades_df = self.portfolio.get_trades_df()
         trades_file = f"../data/{strategy_name}_backtest_trades_{timestamp}.csv"
         trades_df.to_csv(trades_file, index=False)
         
         # 保存组合历史
-        portfolio_df = pd.DataFrame(self.portfolio.portfolio_history)
+        portfolio_df = self.get_portfolio_df()
         portfolio_file = f"../data/{strategy_name}_backtest_portfolio_{timestamp}.csv"
         portfolio_df.to_csv(portfolio_file, index=False)
         
@@ -546,36 +678,16 @@ class SingleStrategyBacktest(MomentumBacktest):
         print(f"   交易记录: {trades_file}")
         print(f"   组合历史: {portfolio_file}")
 
-def run_all_strategies_comparison(start_date, end_date):
-    """运行所有策略对比测试"""
-    print("="*80)
-    print("🔄        全策略对比回测        🔄")
-    print("="*80)
+def run_strategy_for_comparison(strategy, start_date, end_date, symbols, initial_capital):
+    """运行单个策略的对比回测（在子进程中执行）
     
-    strategies = ['volume_breakout', 'multi_timeframe', 'pullback']
-    results_summary = []
-    
-    # 统一的回测参数
-   
-    initial_capital = 100000
-    
-    print(f"📅 统一回测参数:")
-    print(f"   时间范围: {start_date.strftime('%Y-%m-%d')} 到 {end_date.strftime('%Y-%m-%d')}")
-    print(f"   初始资金: ${initial_capital:,.0f}")
-    print("="*80)
-    
-    # 加载币种列表
-    try:
-        with open('../data/exchange_binance_market.txt', 'r', encoding='utf-8') as f:
-            all_symbols = [line.strip() for line in f.readlines() if line.strip()]
-        test_symbols = all_symbols  # 前50个币种
-    except:
-        test_symbols = None
+    返回: (汇总数据, 回测输出日志)，回测失败时汇总数据为None
+    """
+    plt.switch_backend('Agg')  # 子进程只保存图片，不弹出窗口
+    log = io.StringIO()
+    summary = None
     
-    for i, strategy in enumerate(strategies, 1):
-        print(f"\n[{i}/{len(strategies)}] 🧪 测试策略: {strategy}")
-        print("-" * 60)
-        
+    with contextlib.redirect_stdout(log):
         try:
             # 创建单策略回测引擎
             backtest = SingleStrategyBacktest(
@@ -584,12 +696,14 @@ def run_all_strategies_comparison(start_date, end_date):
                 initial_capital=initial_capital,
                 timeframe="1h"  # 默认使用1小时周期
             )
+            # 各策略已各占一个进程，数据在本进程内串行加载，避免每个策略再开一整套加载进程池
+            backtest.load_workers = 1
             
             # 运行回测
             backtest.run_single_strategy_backtest(
                 start_date=start_date,
                 end_date=end_date,
-                symbols=test_symbols
+                symbols=symbols
             )
             
             # 生成报告
@@ -599,18 +713,68 @@ def run_all_strategies_comparison(start_date, end_date):
             backtest.save_strategy_results(results)
             
             # 收集汇总数据
-            results_summary.append({
+            summary = {
                 'strategy': strategy,
                 'display_name': results['strategy_display_name'],
                 'total_return': results['total_return'],
                 'trade_count': len([t for t in results['trades'] if t['action'] == 'SELL']),
                 'final_value': results['final_value']
-            })
+            }
             
         except Exception as e:
             print(f"❌ 策略 {strategy} 测试失败: {str(e)}")
             import traceback
-            traceback.print_exc()
+            traceback.print_exc(file=sys.stdout)
+    
+    return summary, log.getvalue()
+
+def run_all_strategies_comparison(start_date, end_date):
+    """运行所有策略对比测试"""
+    print("="*80)
+    print("🔄        全策略对比回测        🔄")
+    print("="*80)
+    
+    strategies = ['volume_breakout', 'multi_timeframe', 'pullback']
+    results_summary = []
+    
+    # 统一的回测参数
+   
+    initial_capital = 100000
+    
+    print(f"📅 统一回测参数:")
+    print(f"   时间范围: {start_date.strftime('%Y-%m-%d')} 到 {end_date.strftime('%Y-%m-%d')}")
+    print(f"   初始资金: ${initial_capital:,.0f}")
+    print("="*80)
+    
+    # 加载币种列表
+    try:
+        with open('../data/exchange_binance_market.txt', 'r', encoding='utf-8') as f:
+            all_symbols = [line.strip() for line in f.readlines() if line.strip()]
+        test_symbols = all_symbols  # 前50个币种
+    except:
+        test_symbols = None
+    
+    # 各策略回测互不依赖，每个策略一个进程并行运行，哪个策略先完成就先输出它的日志
+    with ProcessPoolExecutor(max_workers=len(strategies)) as executor:
+        future_to_strategy = {executor.submit(run_strategy_for_comparison, strategy, start_date, end_date,
+                                              test_symbols, initial_capital): strategy
+                              for strategy in strategies}
+        print(f"⏳ 已并行启动 {len(strategies)} 个策略的回测: {', '.join(strategies)}")
+        
+        for i, future in enumerate(as_completed(future_to_strategy), 1):
+            strategy = future_to_strategy[future]
+            print(f"\n[{i}/{len(strategies)}] 🧪 策略回测结束: {strategy}")
+            print("-" * 60)
+            
+            # 子进程崩溃或结果无法序列化时只记该策略失败，不影响其余策略的日志和汇总
+            try:
+                summary, log = future.result()
+            except Exception as e:
+                print(f"❌ 策略 {strategy} 测试失败: {str(e)}")
+                continue
+            print(log, end='')
+            if summary:
+                results_summary.append(summary)
     
     # 生成对比报告
     print("\n" + "="*80)
@@ -652,6 +816,7 @@ def main():
     start_date = end_date - timedelta(days=args.days)
     
     if args.strategy == 'all':
+        plt.switch_backend('Agg')  # 批量对比只保存图片，不初始化图形界面
         run_all_strategies_comparison(start_date, end_date)
     else:
         print("="*80)
@@ -665,7 +830,8 @@ def main():
                 data_dir="../data/spot_min_binance",
                 initial_capital=100000,
                 timeframe=args.timeframe,
-                buy_strategy=args.buy_strategy
+                buy_strategy=args.buy_strategy,
+                interactive=True  # 单策略运行时弹出收益曲线图
             )
             
             # 加载币种
@@ -4,21 +4,68 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import pandas as pd
+import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+# 复用连接的HTTP会话（keep-alive连接池），429及5xx响应自动退避重试
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
+# 接口响应的磁盘缓存目录及有效期（秒）：交易对信息每天变化，市值排名变化较慢
+CACHE_DIR = "../data/.cache"
+EXCHANGE_INFO_CACHE_TTL = 6 * 3600
+MARKET_CAP_CACHE_TTL = 3600
+
+def cached_get(url, cache_name, ttl_sec, params=None, timeout=10):
+    """
+    带磁盘缓存的GET请求：缓存文件未超过有效期时直接读取，否则请求接口并写入缓存
+    
+    返回:
+    - tuple: (状态码, JSON数据)，命中缓存时状态码为200，请求失败时数据为None
+    """
+    cache_file = os.path.join(CACHE_DIR, f"{cache_name}.json")
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < ttl_sec:
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return 200, json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            # 缓存文件损坏时视为未命中，重新请求
+            print(f"⚠️  读取缓存失败 {os.path.basename(cache_file)}: {e}")
+    
+    response = SESSION.get(url, params=params, timeout=timeout)
+    if response.status_code != 200:
+        return response.status_code, None
+    
+    data = response.json()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 先写临时文件再替换，避免中断或并发运行时留下写了一半的缓存
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"⚠️  写入缓存失败 {os.path.basename(cache_file)}: {e}")
+    return 200, data
+
 def get_binance_exchange_info():
     """获取币安现货交易对信息"""
     try:
         print("🔍 获取币安现货交易对信息...")
         url = "https://api.binance.com/api/v3/exchangeInfo"
-        response = requests.get(url, timeout=10)
+        status_code, data = cached_get(url, 'binance_exchange_info', EXCHANGE_INFO_CACHE_TTL, timeout=10)
         
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 200:
             symbols = data['symbols']
             
             # 只筛选USDT交易对且状态为TRADING的现货
@@ -32,7 +79,7 @@ def get_binance_exchange_info():
             print(f"✅ 获取到 {len(usdt_symbols)} 个USDT现货交易对")
             return usdt_symbols
         else:
-            print(f"❌ 获取交易对信息失败: {response.status_code}")
+            print(f"❌ 获取交易对信息失败: {status_code}")
             return []
             
     except Exception as e:
@@ -44,19 +91,14 @@ def get_24hr_ticker():
     try:
         print("📊 获取24小时ticker统计...")
         url = "https://api.binance.com/api/v3/ticker/24hr"
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(url, timeout=10)
         
         if response.status_code == 200:
-            data = response.json()
-            ticker_dict = {}
-            for item in data:
-                if item['symbol'].endswith('USDT'):
-                    ticker_dict[item['symbol']] = {
-                        'price': float(item['lastPrice']),
-                        'volume': float(item['volume']),
-                        'quoteVolume': float(item['quoteVolume']),
-                        'priceChangePercent': float(item['priceChangePercent'])
-                    }
+            # 整表筛选USDT交易对并一次性转换数值列，不逐条构造字典
+            df = pd.DataFrame(response.json(), columns=['symbol', 'lastPrice', 'volume', 'quoteVolume', 'priceChangePercent'])
+            df = df[df['symbol'].str.endswith('USDT')].drop_duplicates('symbol', keep='last')
+            df = df.rename(columns={'lastPrice': 'price'}).set_index('symbol').astype(float)
+            ticker_dict = df.to_dict(orient='index')
             
             print(f"✅ 获取到 {len(ticker_dict)} 个USDT交易对的价格数据")
             return ticker_dict
@@ -86,10 +128,9 @@ def get_coinmarketcap_data():
             'sparkline': 'false'
         }
         
-        response = requests.get(url, params=params, timeout=15)
+        status_code, data = cached_get(url, 'coingecko_markets', MARKET_CAP_CACHE_TTL, params=params, timeout=15)
         
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 200:
             market_cap_dict = {}
             
             for coin in data:
@@ -103,7 +144,7 @@ def get_coinmarketcap_data():
             print(f"✅ 获取到 {len(market_cap_dict)} 个币种的市值数据")
             return market_cap_dict
         else:
-            print(f"❌ 获取市值数据失败: {response.status_code}")
+            print(f"❌ 获取市值数据失败: {status_code}")
             return {}
             
     except Exception as e:
@@ -115,45 +156,48 @@ def calculate_market_cap_from_volume(ticker_data):
     基于交易量估算市值（备用方法）
     这是一个粗略的估算，仅作为后备方案
     """
-    estimated_caps = {}
+    # 成交额和价格取成数组，对全部交易对一次性估算
+    symbols = np.array(list(ticker_data), dtype=object)
+    quote_volumes = np.fromiter((data.get('quoteVolume', 0) for data in ticker_data.values()),
+                                dtype=np.float64, count=len(ticker_data))
+    prices = np.fromiter((data.get('price', 0) for data in ticker_data.values()),
+                         dtype=np.float64, count=len(ticker_data))
     
-    # 获取一些已知的大币种作为基准
-    btc_volume = ticker_data.get('BTCUSDT', {}).get('quoteVolume', 1000000000)
+    # 粗略估算：基于交易量相对比例，只估算有成交额和价格的交易对
+    valid = (quote_volumes > 0) & (prices > 0)
     
-    for symbol, data in ticker_data.items():
-        quote_volume = data.get('quoteVolume', 0)
-        price = data.get('price', 0)
-        
-        # 粗略估算：基于交易量相对比例
-        if quote_volume > 0 and price > 0:
-            # 假设市值与交易量有一定相关性
-            estimated_cap = quote_volume * 50  # 简化的估算倍数
-            estimated_caps[symbol] = max(estimated_cap, quote_volume)
+    # 假设市值与交易量有一定相关性
+    estimated_caps = np.maximum(quote_volumes[valid] * 50, quote_volumes[valid])  # 简化的估算倍数
     
-    return estimated_caps
+    return dict(zip(symbols[valid].tolist(), estimated_caps.tolist()))
 
 def filter_by_market_cap(symbols_data, min_market_cap=30000000):
     """
     根据市值筛选币种
     min_market_cap: 最小市值（默认3000万美元）
     """
-    filtered_symbols = []
+    symbols = list(symbols_data)
+    market_caps = np.fromiter((symbols_data[symbol].get('market_cap') or 0 for symbol in symbols),
+                              dtype=np.float64, count=len(symbols))
     
-    for symbol, data in symbols_data.items():
-        market_cap = data.get('market_cap', 0)
-        if market_cap >= min_market_cap:
-            filtered_symbols.append({
-                'symbol': symbol,
-                'market_cap': market_cap,
-                'name': data.get('name', ''),
-                'rank': data.get('rank', 999),
-                'price': data.get('price', 0),
-                'volume_24h': data.get('quoteVolume', 0),
-                'price_change_24h': data.get('priceChangePercent', 0)
-            })
+    # 先按市值筛选，再按市值降序排序（市值相同保持原顺序），只为入选的币种生成记录
+    selected = np.flatnonzero(market_caps >= min_market_cap)
+    selected = selected[np.argsort(-market_caps[selected], kind='stable')]
+    
+    filtered_symbols = []
+    for i in selected:
+        symbol = symbols[i]
+        data = symbols_data[symbol]
+        filtered_symbols.append({
+            'symbol': symbol,
+            'market_cap': data.get('market_cap', 0),
+            'name': data.get('name', ''),
+            'rank': data.get('rank', 999),
+            'price': data.get('price', 0),
+            'volume_24h': data.get('quoteVolume', 0),
+            'price_change_24h': data.get('priceChangePercent', 0)
+        })
     
-    # 按市值排序
-    filtered_symbols.sort(key=lambda x: x['market_cap'], reverse=True)
     return filtered_symbols
 
 def save_symbols_to_file(symbols_data, filename):
@@ -176,9 +220,10 @@ def save_symbols_to_file(symbols_data, filename):
         csv_filename = filename.replace('.txt', '_details.csv')
         csv_filepath = os.path.join(data_dir, csv_filename)
         
-        df = pd.DataFrame(symbols_data)
-        df['market_cap_millions'] = df['market_cap'] / 1000000  # 转换为百万美元
-        df = df[['symbol', 'name', 'rank', 'market_cap_millions', 'price', 'volume_24h', 'price_change_24h']]
+        # 按输出列顺序直接构建DataFrame，市值原地换算为百万美元，不再整表构建后另行选列复制
+        df = pd.DataFrame(symbols_data, columns=['symbol', 'name', 'rank', 'market_cap', 'price', 'volume_24h', 'price_change_24h'])
+        df['market_cap'] /= 1000000  # 转换为百万美元
+        df = df.rename(columns={'market_cap': 'market_cap_millions'})
         df.to_csv(csv_filepath, index=False)
         
         print(f"✅ 详细信息已保存到: {csv_filepath}")
@@ -193,22 +238,25 @@ def main():
     print("📋 功能: 获取市值≥3000万美元的币安现货")
     print("=" * 60)
     
-    # 1. 获取币安交易对信息
-    binance_symbols = get_binance_exchange_info()
+    # 1-3. 交易对信息、价格交易量、市值数据互不依赖，三个请求并发执行
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        exchange_future = executor.submit(get_binance_exchange_info)
+        ticker_future = executor.submit(get_24hr_ticker)
+        market_cap_future = executor.submit(get_coinmarketcap_data)
+        binance_symbols = exchange_future.result()
+        ticker_data = ticker_future.result()
+        market_cap_data = market_cap_future.result()
+    
     if not binance_symbols:
         print("❌ 无法获取币安交易对信息，程序退出")
         return
     
-    # 2. 获取价格和交易量数据
-    ticker_data = get_24hr_ticker()
     if not ticker_data:
         print("❌ 无法获取价格数据，程序退出")
         return
     
-    # 3. 获取市值数据
-    market_cap_data = get_coinmarketcap_data()
-    
-    # 4. 合并数据
+    # 4. 合并数据（没有市值数据的交易对使用交易量估算，全部交易对一次算好）
+    estimated_caps = calculate_market_cap_from_volume(ticker_data)
     combined_data = {}
     for symbol in binance_symbols:
         if symbol in ticker_data:
@@ -219,7 +267,6 @@ def main():
                 combined_data[symbol].update(market_cap_data[symbol])
             else:
                 # 如果没有市值数据，使用交易量估算
-                estimated_caps = calculate_market_cap_from_volume({symbol: ticker_data[symbol]})
                 combined_data[symbol]['market_cap'] = estimated_caps.get(symbol, 0)
                 combined_data[symbol]['name'] = symbol.replace('USDT', '')
                 combined_data[symbol]['rank'] = 999
@@ -4,6 +4,8 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pytz
 import time
 from enum import Enum
@@ -11,6 +13,7 @@ from datetime import datetime, timedelta
 import pandas as pd
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -24,6 +27,9 @@ KLINE_URL_S = '/api/v3/klines' # K线数据
 
 BINANCE_SPOT_LIMIT = 500
 
+# 单个币种分页请求的最大并发数（控制在币安请求权重限制以内）
+MAX_CONCURRENT_REQUESTS = 10
+
 # 单位 ms
 MIN_INTERVAL = 60 * 1000
 MIN_15_INTERVAL = 60 * 15 * 1000
@@ -38,8 +44,22 @@ interval_dict = {
 }
 
 BINANCE_SPOT_DAT_COL=['openTime', 'open', 'high', 'low', 'close', 'volumn', 'closeTime', 'quote_volumn', 'trades', 'taker_base_volumn', 'taker_quote_volumn', 'ignore']
+
+# K线各列的数值类型（构建DataFrame后一次性astype转换）
+KLINE_DTYPES = {
+    'openTime': 'int64', 'open': 'float64', 'high': 'float64', 'low': 'float64', 'close': 'float64',
+    'volumn': 'float64', 'quote_volumn': 'float64', 'trades': 'int64',
+    'taker_base_volumn': 'float64', 'taker_quote_volumn': 'float64'
+}
 proxies = None
 
+# 复用连接的HTTP会话（keep-alive连接池），429及5xx响应自动退避重试
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
 CHINA_TZ = pytz.timezone("Asia/Shanghai")
 pd.set_option('expand_frame_repr', False)
 pd.set_option('display.max_rows', 5000)
@@ -51,9 +71,22 @@ def parse_time_str(time_str):
     """解析时间字符串，格式: 2025-08-30_22_42"""
     return datetime.strptime(time_str, '%Y-%m-%d_%H_%M').replace(tzinfo=CHINA_TZ)
 
+def kline_windows(start_timestamp, end_timestamp, interval_int, limit):
+    """按单次请求的K线数量上限，把时间区间切分为分页窗口列表[(开始时间, 结束时间), ...]"""
+    windows = []
+    current_timestamp = start_timestamp
+    while current_timestamp < end_timestamp:
+        next_timestamp = min(current_timestamp + limit * interval_int, end_timestamp)
+        windows.append((current_timestamp, next_timestamp))
+        current_timestamp = next_timestamp
+    return windows
+
 def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output_path):
     """
     获取K线数据
+    
+    返回:
+    - bool: 全部分页请求成功且数据已保存
     """
     print(f"正在获取 {symbol} {interval} 数据...")
     
@@ -66,49 +99,56 @@ def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output
     start_timestamp = int(start_time.timestamp() * 1000)
     end_timestamp = int(end_time.timestamp() * 1000)
     
-    total_data = pd.DataFrame()
+    if data_type != DataType.SPOT:
+        print(f"❌ 暂不支持 {data_type.value} 类型的K线数据")
+        return False
     
-    current_timestamp = start_timestamp
+    # 各页返回的原始K线行先收集到列表，全部返回后一次性构建DataFrame并转换类型
+    rows = []
+    failed_pages = 0
     
-    while current_timestamp < end_timestamp:
-        next_timestamp = min(current_timestamp + limit * interval_int, end_timestamp)
-        
-        if data_type == DataType.SPOT:
-            url = BASE_URL_S + KLINE_URL_S
-            params = {
+    # 先算好全部分页窗口，并发请求，再按窗口顺序处理结果
+    url = BASE_URL_S + KLINE_URL_S
+    windows = kline_windows(start_timestamp, end_timestamp, interval_int, limit)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        futures = [
+            executor.submit(SESSION.get, url, params={
                 'symbol': symbol,
                 'interval': interval,
-                'startTime': current_timestamp,
-                'endTime': next_timestamp,
+                'startTime': window_start,
+                'endTime': window_end,
                 'limit': limit
-            }
+            }, proxies=proxies, timeout=10)
+            for window_start, window_end in windows
+        ]
         
-        try:
-            response = requests.get(url, params=params, proxies=proxies, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    df = pd.DataFrame(data, columns=BINANCE_SPOT_DAT_COL)
-                    df['openTime'] = pd.to_datetime(df['openTime'], unit='ms')
-                    
-                    numeric_columns = ['open', 'high', 'low', 'close', 'volumn', 'quote_volumn', 'trades', 'taker_base_volumn', 'taker_quote_volumn']
-                    for col in numeric_columns:
-                        df[col] = pd.to_numeric(df[col])
-                    
-                    total_data = pd.concat([total_data, df], ignore_index=True)
-                    print(f"  获取了 {len(df)} 条记录, 时间范围: {df['openTime'].iloc[0]} - {df['openTime'].iloc[-1]}")
+        for (window_start, _), future in zip(windows, futures):
+            try:
+                response = future.result()
+                if response.status_code == 200:
+                    data = response.json()
+                    if data:
+                        rows.extend(data)
+                        print(f"  获取了 {len(data)} 条记录, 时间范围: {pd.to_datetime(data[0][0], unit='ms')} - {pd.to_datetime(data[-1][0], unit='ms')}")
+                    else:
+                        print(f"  {symbol} 在 {window_start} 时间段没有数据")
                 else:
-                    print(f"  {symbol} 在 {current_timestamp} 时间段没有数据")
-            else:
-                print(f"  请求失败: {response.status_code}")
-                
-        except Exception as e:
-            print(f"  请求异常: {str(e)}")
-            
-        current_timestamp = next_timestamp
-        time.sleep(0.1)  # 避免频率限制
+                    failed_pages += 1
+                    print(f"  请求失败: {response.status_code}")
+                    
+            except Exception as e:
+                failed_pages += 1
+                print(f"  请求异常: {str(e)}")
     
-    if not total_data.empty:
+    # 任一分页失败（重试用尽的429/5xx或网络异常）都会留下数据缺口，不保存不完整的数据
+    if failed_pages:
+        print(f"❌ {symbol} 有 {failed_pages}/{len(windows)} 页请求失败，本次不保存")
+        return False
+    
+    if rows:
+        total_data = pd.DataFrame(rows, columns=BINANCE_SPOT_DAT_COL).astype(KLINE_DTYPES)
+        total_data['openTime'] = pd.to_datetime(total_data['openTime'], unit='ms')
+        
         total_data = total_data.drop_duplicates(subset=['openTime'])
         total_data = total_data.sort_values('openTime')
         
@@ -119,8 +159,10 @@ def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output
         output_file = f'{output_dir}/{symbol}_{interval}_{start_time_str}_{end_time_str}.csv'
         total_data.to_csv(output_file, index=False)
         print(f"✅ {symbol} 数据已保存到 {output_file}, 共 {len(total_data)} 条记录")
-    else:
-        print(f"❌ {symbol} 没有获取到任何数据")
+        return True
+    
+    print(f"❌ {symbol} 没有获取到任何数据")
+    return False
 
 def get_current_time_range():
     """
@@ -171,8 +213,8 @@ def get_latest_batch():
     for i, symbol in enumerate(symbols, 1):
         print(f"\n[{i}/{len(symbols)}] 处理 {symbol}...")
         try:
-            get_klines(DataType.SPOT, symbol, "15m", start_str, end_str, 'min')
-            success_count += 1
+            if get_klines(DataType.SPOT, symbol, "15m", start_str, end_str, 'min'):
+                success_count += 1
         except Exception as e:
             print(f"❌ {symbol} 获取失败: {str(e)}")
         
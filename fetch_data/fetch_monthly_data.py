@@ -4,14 +4,17 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pytz
-import time
 from enum import Enum
 from datetime import datetime, timedelta
 import pandas as pd
 import sys
 import os
 import json
+import glob
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -25,6 +28,9 @@ KLINE_URL_S = '/api/v3/klines'
 
 BINANCE_SPOT_LIMIT = 1000  # 增加单次请求限制
 
+# 单个币种分页请求的最大并发数（控制在币安请求权重限制以内）
+MAX_CONCURRENT_REQUESTS = 10
+
 # 单位 ms
 MIN_INTERVAL = 60 * 1000
 MIN_15_INTERVAL = 60 * 15 * 1000
@@ -39,8 +45,22 @@ interval_dict = {
 }
 
 BINANCE_SPOT_DAT_COL=['openTime', 'open', 'high', 'low', 'close', 'volumn', 'closeTime', 'quote_volumn', 'trades', 'taker_base_volumn', 'taker_quote_volumn', 'ignore']
+
+# K线各列的数值类型（构建DataFrame后一次性astype转换）
+KLINE_DTYPES = {
+    'openTime': 'int64', 'open': 'float64', 'high': 'float64', 'low': 'float64', 'close': 'float64',
+    'volumn': 'float64', 'quote_volumn': 'float64', 'trades': 'int64',
+    'taker_base_volumn': 'float64', 'taker_quote_volumn': 'float64'
+}
 proxies = None
 
+# 复用连接的HTTP会话（keep-alive连接池），429及5xx响应自动退避重试
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
 CHINA_TZ = pytz.timezone("Asia/Shanghai")
 pd.set_option('expand_frame_repr', False)
 pd.set_option('display.max_rows', 5000)
@@ -66,12 +86,23 @@ def get_one_month_time_range():
     
     return start_str, end_str
 
-def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output_path):
-    """
-    获取K线数据
+def kline_windows(start_timestamp, end_timestamp, interval_int, limit):
+    """按单次请求的K线数量上限，把时间区间切分为分页窗口列表[(开始时间, 结束时间), ...]"""
+    windows = []
+    current_timestamp = start_timestamp
+    while current_timestamp < end_timestamp:
+        next_timestamp = min(current_timestamp + limit * interval_int, end_timestamp)
+        windows.append((current_timestamp, next_timestamp))
+        current_timestamp = next_timestamp
+    return windows
+
+def submit_klines(executor, data_type, symbol, interval, start_time_str, end_time_str, output_path):
     """
-    print(f"正在获取 {symbol} {interval} 数据...")
+    计算币种的输出文件和全部分页窗口，把各页请求提交到线程池（不等待结果）
     
+    返回:
+    - dict: 拉取任务，交给collect_klines按窗口顺序处理结果并保存
+    """
     interval_int = interval_dict[interval]
     limit = BINANCE_SPOT_LIMIT
     
@@ -81,75 +112,133 @@ def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output
     start_timestamp = int(start_time.timestamp() * 1000)
     end_timestamp = int(end_time.timestamp() * 1000)
     
-    total_data = pd.DataFrame()
+    job = {'data_type': data_type, 'symbol': symbol, 'interval': interval, 'futures': []}
+    if data_type != DataType.SPOT:
+        return job
     
-    current_timestamp = start_timestamp
-    request_count = 0
+    output_dir = f'../data/spot_{output_path}_binance'
+    job['output_dir'] = output_dir
+    job['output_file'] = f'{output_dir}/{symbol}_{interval}_{start_time_str}_{end_time_str}.csv'
     
-    while current_timestamp < end_timestamp:
-        next_timestamp = min(current_timestamp + limit * interval_int, end_timestamp)
+    # 文件名带有拉取时刻，每次运行都不同：从新到旧查找该币种的已有文件，只拉取其最后一根K线之后的数据（增量更新）
+    # 已有文件必须从本次起始时间开始（允许一个周期的误差），否则开头会缺数据（如最新数据脚本写入的5天文件），不能用于续传
+    job['existing_data'] = None
+    start_time_utc = pd.to_datetime(start_timestamp, unit='ms')
+    existing_files = [f for f in glob.glob(f'{output_dir}/{symbol}_{interval}_*.csv') if os.path.getsize(f) > 0]
+    for existing_file in sorted(existing_files, key=os.path.getmtime, reverse=True):
+        try:
+            existing_data = pd.read_csv(existing_file, parse_dates=['openTime'])
+        except Exception as e:
+            print(f"⚠️  读取已有数据失败 {os.path.basename(existing_file)}: {str(e)}")
+            continue
         
-        if data_type == DataType.SPOT:
-            url = BASE_URL_S + KLINE_URL_S
-            params = {
-                'symbol': symbol,
-                'interval': interval,
-                'startTime': current_timestamp,
-                'endTime': next_timestamp,
-                'limit': limit
-            }
+        if len(existing_data) == 0 or existing_data['openTime'].iloc[0] > start_time_utc + pd.Timedelta(milliseconds=interval_int):
+            continue
         
+        # 只保留本次时间范围内的已有记录，合并后写入新文件（来源文件保留不动）
+        existing_data = existing_data[existing_data['openTime'] >= start_time_utc]
+        if len(existing_data) > 0:
+            job['existing_data'] = existing_data
+            # 上次拉取结束时最后一根K线可能尚未收盘（收盘价、成交量不完整）：从这根K线重新拉取，用新数据覆盖
+            last_timestamp = pd.Timestamp(existing_data['openTime'].iloc[-1]).value // 10**6
+            start_timestamp = max(start_timestamp, last_timestamp)
+            job['resume_timestamp'] = start_timestamp
+            job['existing_file'] = existing_file
+        break
+    
+    # 先算好全部分页窗口并提交请求（线程池并发数即频率控制）
+    url = BASE_URL_S + KLINE_URL_S
+    job['futures'] = [
+        executor.submit(SESSION.get, url, params={
+            'symbol': symbol,
+            'interval': interval,
+            'startTime': window_start,
+            'endTime': window_end,
+            'limit': limit
+        }, proxies=proxies, timeout=15)
+        for window_start, window_end in kline_windows(start_timestamp, end_timestamp, interval_int, limit)
+    ]
+    return job
+
+def collect_klines(job):
+    """
+    按窗口顺序处理submit_klines提交的各页请求结果，合并已有数据后保存
+    
+    返回:
+    - bool: 全部分页请求成功且有可用数据
+    """
+    symbol = job['symbol']
+    print(f"正在获取 {symbol} {job['interval']} 数据...")
+    
+    if job['data_type'] != DataType.SPOT:
+        print(f"❌ 暂不支持 {job['data_type'].value} 类型的K线数据")
+        return False
+    
+    existing_data = job['existing_data']
+    if 'resume_timestamp' in job:
+        print(f"  已有 {len(existing_data)} 条记录（{os.path.basename(job['existing_file'])}），从 {pd.to_datetime(job['resume_timestamp'], unit='ms').strftime('%m-%d %H:%M')} 开始增量拉取")
+    
+    # 各页返回的原始K线行先收集到列表，全部返回后一次性构建DataFrame并转换类型
+    rows = []
+    failed_pages = 0
+    for future in job['futures']:
         try:
-            response = requests.get(url, params=params, proxies=proxies, timeout=15)
-            request_count += 1
+            response = future.result()
             
             if response.status_code == 200:
                 data = response.json()
                 if data:
-                    df = pd.DataFrame(data, columns=BINANCE_SPOT_DAT_COL)
-                    df['openTime'] = pd.to_datetime(df['openTime'], unit='ms')
-                    
-                    numeric_columns = ['open', 'high', 'low', 'close', 'volumn', 'quote_volumn', 'trades', 'taker_base_volumn', 'taker_quote_volumn']
-                    for col in numeric_columns:
-                        df[col] = pd.to_numeric(df[col])
-                    
-                    total_data = pd.concat([total_data, df], ignore_index=True)
-                    print(f"  ✓ 获取 {len(df)} 条记录 [{df['openTime'].iloc[0].strftime('%m-%d %H:%M')} - {df['openTime'].iloc[-1].strftime('%m-%d %H:%M')}]")
+                    rows.extend(data)
+                    print(f"  ✓ 获取 {len(data)} 条记录 [{pd.to_datetime(data[0][0], unit='ms').strftime('%m-%d %H:%M')} - {pd.to_datetime(data[-1][0], unit='ms').strftime('%m-%d %H:%M')}]")
                 else:
                     print(f"  - 时间段无数据")
-            elif response.status_code == 429:
-                print(f"  ⚠️  API限制，等待60秒...")
-                time.sleep(60)
-                continue
             else:
+                failed_pages += 1
                 print(f"  ❌ 请求失败: {response.status_code}")
                 
         except Exception as e:
+            failed_pages += 1
             print(f"  ❌ 请求异常: {str(e)}")
-            
-        current_timestamp = next_timestamp
-        
-        # 控制请求频率，避免触发限制
-        if request_count % 10 == 0:
-            time.sleep(1)  # 每10个请求暂停1秒
-        else:
-            time.sleep(0.1)  # 每个请求暂停0.1秒
-    
-    if not total_data.empty:
-        total_data = total_data.drop_duplicates(subset=['openTime'])
-        total_data = total_data.sort_values('openTime')
-        
-        # 确保输出目录存在
-        output_dir = f'../data/spot_{output_path}_binance'
-        os.makedirs(output_dir, exist_ok=True)
-        
-        output_file = f'{output_dir}/{symbol}_{interval}_{start_time_str}_{end_time_str}.csv'
-        total_data.to_csv(output_file, index=False)
-        print(f"✅ {symbol} 数据已保存: {len(total_data)} 条记录")
-        return True
-    else:
+    
+    # 任一分页失败（重试用尽的429/5xx或网络异常）都会留下数据缺口：不保存，记为失败以便下次重新拉取
+    if failed_pages:
+        print(f"❌ {symbol} 有 {failed_pages}/{len(job['futures'])} 页请求失败，本次不保存")
+        return False
+    
+    if not rows and existing_data is None:
         print(f"❌ {symbol} 没有获取到任何数据")
         return False
+    
+    frames = [] if existing_data is None else [existing_data]
+    if rows:
+        new_data = pd.DataFrame(rows, columns=BINANCE_SPOT_DAT_COL).astype(KLINE_DTYPES)
+        new_data['openTime'] = pd.to_datetime(new_data['openTime'], unit='ms')
+        frames.append(new_data)
+    
+    total_data = pd.concat(frames, ignore_index=True)
+    # 重叠的K线以本次拉取的为准（替换已有文件中未收盘的旧记录）
+    total_data = total_data.drop_duplicates(subset=['openTime'], keep='last')
+    total_data = total_data.sort_values('openTime')
+    
+    # 确保输出目录存在
+    os.makedirs(job['output_dir'], exist_ok=True)
+    
+    # 即使没有新K线也写入本次的文件名，保证最新文件覆盖本次时间范围
+    total_data.to_csv(job['output_file'], index=False)
+    
+    if rows:
+        print(f"✅ {symbol} 数据已保存: {len(total_data)} 条记录")
+    else:
+        print(f"✅ {symbol} 已是最新数据: {len(total_data)} 条记录")
+    return True
+
+def get_klines(data_type, symbol, interval, start_time_str, end_time_str, output_path):
+    """
+    获取K线数据
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        job = submit_klines(executor, data_type, symbol, interval, start_time_str, end_time_str, output_path)
+        return collect_klines(job)
 
 def load_symbols_from_file():
     """从文件加载币种列表"""
@@ -225,12 +314,16 @@ def get_monthly_batch():
     print("开始数据拉取...")
     print("="*80)
     
-    for i, symbol in enumerate(symbols, 1):
+    # 全部币种的分页请求一次性提交到同一个线程池，请求并发进行，再按币种顺序处理结果
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+    jobs = [submit_klines(executor, DataType.SPOT, symbol, "15m", start_str, end_str, 'min') for symbol in symbols]
+    
+    for i, (symbol, job) in enumerate(zip(symbols, jobs), 1):
         total_progress = len(completed_symbols) + i
         print(f"\n[{total_progress}/{len(symbols) + len(completed_symbols)}] 处理 {symbol}...")
         
         try:
-            success = get_klines(DataType.SPOT, symbol, "15m", start_str, end_str, 'min')
+            success = collect_klines(job)
             
             if success:
                 completed_symbols.append(symbol)
@@ -243,6 +336,7 @@ def get_monthly_batch():
                 
         except KeyboardInterrupt:
             print(f"\n⛔ 用户中断，保存当前进度...")
+            executor.shutdown(wait=False, cancel_futures=True)
             save_progress(completed_symbols, failed_symbols, progress_file)
             print(f"📊 当前进度: 成功 {success_count}, 失败 {fail_count}")
             return
@@ -256,11 +350,8 @@ def get_monthly_batch():
         if i % 10 == 0:
             save_progress(completed_symbols, failed_symbols, progress_file)
             print(f"📝 已保存进度: 成功 {success_count}, 失败 {fail_count}")
-        
-        # 每处理5个币种暂停一下，避免频率限制
-        if i % 5 == 0:
-            print("⏱️  暂停3秒...")
-            time.sleep(3)
+    
+    executor.shutdown()
     
     # 保存最终进度
     save_progress(completed_symbols, failed_symbols, progress_file)